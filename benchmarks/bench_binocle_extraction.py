@@ -0,0 +1,87 @@
+"""
+Benchmark Binocle URL extraction on saved archive pages.
+
+Compares the byte scanner (extract_binocle_url) with the BeautifulSoup
+fallback (extract_binocle_url_soup): parse time and peak Python memory.
+
+Usage:
+    python -m benchmarks.bench_binocle_extraction page1.html [page2.html ...] [--repeat 20]
+    python -m benchmarks.bench_binocle_extraction --check
+
+--check runs a regression check of the streamed lookup instead: a page
+received in chunks whose URL only the BeautifulSoup fallback can find.
+
+Save pages with e.g. `curl -o page.html "<archive page URL>"`.
+"""
+import sys
+import time
+import argparse
+import tracemalloc
+
+from src.web_fetcher import extract_binocle_url, extract_binocle_url_soup, scan_binocle_url
+
+CHECK_URL = "https://archives.example/binocle/BIN_42.json?v=1"
+
+
+def measure(fn, content, repeat):
+    """Returns (result, best time in ms, peak traced memory in KiB)."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(content)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best * 1000, peak / 1024
+
+
+def check_chunked_fallback(chunk_size=1000):
+    """
+    Feed a UTF-16 page (invisible to the byte scanner) to scan_binocle_url in
+    chunks: the fallback must get the whole page, not the scanner's tail.
+    """
+    filler = "<p>" + "x" * 200 + "</p>\n"
+    html = ("<html><head><meta charset=\"utf-16\"></head><body>" + filler * 200 +
+            "<script type=\"text/javascript\">binocle({\"source\":\"" + CHECK_URL.replace('/', '\\/') +
+            "\"});</script>" + filler * 20 + "</body></html>")
+    content = html.encode('utf-16')
+    chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+
+    assert extract_binocle_url(content) is None, "the byte scanner should not find the UTF-16 URL"
+    result = scan_binocle_url(iter(chunks))
+    assert result == CHECK_URL, f"chunked fallback returned {result!r}, expected {CHECK_URL!r}"
+    print(f"OK: URL found by the fallback from {len(chunks)} chunks ({len(content) / 1024:.0f} KiB)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Binocle URL extraction")
+    parser.add_argument("pages", nargs='*', help="Saved archive HTML pages")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per method (best time is kept)")
+    parser.add_argument("--check", action="store_true", help="Run the chunked fallback regression check")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        check_chunked_fallback()
+        return 0
+    if not args.pages:
+        parser.error("give saved pages to benchmark, or --check")
+
+    print(f"{'page':<40} {'size KiB':>9} {'scan ms':>9} {'soup ms':>9} {'speedup':>8} {'scan KiB':>9} {'soup KiB':>9}")
+    for path in args.pages:
+        with open(path, 'rb') as f:
+            content = f.read()
+        fast, fast_ms, fast_mem = measure(extract_binocle_url, content, args.repeat)
+        slow, slow_ms, slow_mem = measure(extract_binocle_url_soup, content, args.repeat)
+        if fast != slow:
+            print(f"WARNING: results differ for {path}: {fast!r} != {slow!r}", file=sys.stderr)
+        print(f"{path[-40:]:<40} {len(content) / 1024:>9.1f} {fast_ms:>9.2f} {slow_ms:>9.2f} "
+              f"{slow_ms / fast_ms if fast_ms else float('inf'):>7.1f}x {fast_mem:>9.1f} {slow_mem:>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
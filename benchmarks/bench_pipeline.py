@@ -0,0 +1,89 @@
+"""
+Offline throughput benchmark of the fetch -> download -> transcribe
+pipeline against the local stand-in server (see standin_server.py).
+
+Runs the batch pipeline once per worker count, each time with empty
+caches, and reports the time of each stage, pages per minute and what
+the server saw (requests, 429 throttling, injected errors).
+
+Usage:
+    python -m benchmarks.bench_pipeline [--pages 20] [--workers 1,2,4,8] [--gemini-latency 3]
+        [--throttle-rpm 60] [--error-rate 0.02] [--recording DIR] [--image scan.jpg]
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+from src.batch import BatchRunner
+from src.transport import LocalRedirectAdapter
+from benchmarks.standin_server import StandinServer, STANDIN_ARCHIVE_URL
+
+
+def run_once(server, args, workers, archive_url):
+    """Returns (stage times in seconds, summary) of one pipeline run with empty caches."""
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    try:
+        os.makedirs(os.path.join(workdir, "images"))
+        transport = LocalRedirectAdapter(server.url, pool_size=max(workers, args.download_workers))
+        runner = BatchRunner(os.path.join(workdir, "images"), "standin", args.prompt, workers,
+                             args.download_workers, args.rate, False, args.rpm, None, args.bands,
+                             transport, server.url, os.path.join(workdir, "cache"))
+        pages = list(range(1, args.pages + 1))
+
+        start = time.perf_counter()
+        pages = runner.resolve(archive_url, pages)
+        resolved = time.perf_counter()
+        runner.download(pages)
+        downloaded = time.perf_counter()
+        summary = runner.run(archive_url, pages)
+        done = time.perf_counter()
+        return (resolved - start, downloaded - resolved, done - downloaded, done - start), summary
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark")
+    parser.add_argument("--pages", type=int, default=20, help="Pages to process")
+    parser.add_argument("--workers", default="1,2,4,8", help="Comma-separated page worker counts to compare")
+    parser.add_argument("--download-workers", type=int, default=4, help="Concurrent image downloads")
+    parser.add_argument("--rate", type=float, default=0, help="Client download requests per second per host (0: unlimited)")
+    parser.add_argument("--rpm", type=float, default=0, help="Client Gemini requests per minute (0: unlimited)")
+    parser.add_argument("--bands", type=int, default=1, help="Bands per page")
+    parser.add_argument("--latency", type=float, default=0.05, help="Server latency of archive/image requests (s)")
+    parser.add_argument("--gemini-latency", type=float, default=3.0, help="Server time per transcription (s)")
+    parser.add_argument("--image-bandwidth", type=float, default=0, help="Image bytes/s per request (0: unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 500 per request")
+    parser.add_argument("--throttle-rpm", type=float, default=0, help="Server Gemini requests per minute before 429")
+    parser.add_argument("--recording", help="Recording directory (default: synthetic register)")
+    parser.add_argument("--archive-url", help="Archive URL to process (default: the synthetic register)")
+    parser.add_argument("--image", help="JPEG served for every synthetic page (default: generated)")
+    parser.add_argument("--prompt", default="Prompt.txt", help="Prompt file")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the error injection")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    archive_url = args.archive_url or STANDIN_ARCHIVE_URL
+
+    print(f"{'workers':>7} {'resolve s':>9} {'download s':>10} {'transcribe s':>12} {'total s':>8} "
+          f"{'pages/min':>9} {'done':>5} {'failed':>6} {'gemini req':>10} {'429':>5} {'5xx':>5}")
+    for workers in [int(w) for w in args.workers.split(',')]:
+        with StandinServer(args.pages, args.latency, args.gemini_latency, args.error_rate, args.throttle_rpm,
+                           args.image_bandwidth, image=args.image, recording_dir=args.recording,
+                           seed=args.seed) as server:
+            times, summary = run_once(server, args, workers, archive_url)
+            stats = server.stats
+        resolve_s, download_s, transcribe_s, total_s = times
+        processed = summary["done"] + summary["skipped"]
+        print(f"{workers:>7} {resolve_s:>9.2f} {download_s:>10.2f} {transcribe_s:>12.2f} {total_s:>8.2f} "
+              f"{processed / total_s * 60:>9.1f} {summary['done']:>5} {summary['failed']:>6} "
+              f"{stats['gemini']:>10} {stats['throttled']:>5} {stats['errors']:>5}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Startup time report: import time per top-level package (python -X importtime)
+and time to first window of the application.
+
+Time to first window is measured from process launch to the first event
+loop iteration after the main window is shown (reported by the app when
+THOTINDEX_STARTUP_PROBE is set), split into module loading and window
+construction. With --exe it measures the frozen PyInstaller build instead.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 5] [--top 15] [--exe dist/ThotIndex.exe]
+
+On a machine without display, set QT_QPA_PLATFORM=offscreen.
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from collections import defaultdict
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def import_breakdown(module="src.main"):
+    """
+    Returns ({top-level package: self import time in ms}, total ms) for a
+    fresh interpreter importing module.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, timeout=300)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    packages = defaultdict(float)
+    total = 0.0
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        packages[name.split('.')[0]] += int(self_us) / 1000
+        if len(indent) == 1:
+            # Imported directly by the -c statement
+            total += int(cumulative_us) / 1000
+    return dict(packages), total
+
+
+def time_to_first_window(command):
+    """
+    Launch the application once.
+
+    Returns:
+        dict: Seconds from launch to "modules_loaded", "window_created" and "first_window"
+    """
+    fd, probe_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    os.remove(probe_path)
+    env = dict(os.environ, THOTINDEX_STARTUP_PROBE=probe_path)
+    try:
+        launched = time.time()
+        subprocess.run(command, env=env, timeout=300, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with open(probe_path, 'r') as f:
+            probe = json.load(f)
+        return {key: probe[key] - launched for key in ("modules_loaded", "window_created", "first_window")}
+    except FileNotFoundError:
+        raise RuntimeError(f"The application exited without reporting its startup: {command}")
+    finally:
+        if os.path.exists(probe_path):
+            os.remove(probe_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Startup time report")
+    parser.add_argument("--runs", type=int, default=5, help="Application launches (median is reported)")
+    parser.add_argument("--top", type=int, default=15, help="Packages listed in the import breakdown")
+    parser.add_argument("--exe", help="Frozen executable to launch instead of python -m src.main")
+    parser.add_argument("--no-imports", action="store_true", help="Skip the -X importtime breakdown")
+    args = parser.parse_args(argv)
+
+    if not args.no_imports:
+        packages, total = import_breakdown()
+        print(f"Import of src.main: {total:.0f} ms")
+        print(f"{'package':<30} {'self ms':>9}")
+        for name, ms in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"{name:<30} {ms:>9.1f}")
+        print()
+
+    command = [args.exe] if args.exe else [sys.executable, "-m", "src.main"]
+    runs = [time_to_first_window(command) for _ in range(args.runs)]
+    median = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    print(f"Time to first window ({' '.join(command)}), median of {len(runs)} runs:")
+    print(f"  interpreter start + imports  {median['modules_loaded'] * 1000:>7.0f} ms")
+    print(f"  window construction          {(median['window_created'] - median['modules_loaded']) * 1000:>7.0f} ms")
+    print(f"  first event loop iteration   {(median['first_window'] - median['window_created']) * 1000:>7.0f} ms")
+    print(f"  total                        {median['first_window'] * 1000:>7.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
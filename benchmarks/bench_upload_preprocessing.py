@@ -0,0 +1,132 @@
+"""
+Benchmark the image preprocessing done before Gemini uploads.
+
+For each image and preprocessing variant: preparation time, output size
+and payload size. With an API key, also the API latency and the accuracy
+of the transcription against a reference TSV (the hand-corrected file
+next to the image by default, else the output of the first variant).
+
+Variants are written MAX_EDGE:FORMAT[:QUALITY][:gray][:ac], e.g.
+    0:PNG             original size, lossless
+    3072:JPEG:90      default settings
+    2048:WEBP:80:gray:ac
+
+Usage:
+    python -m benchmarks.bench_upload_preprocessing scan1.jpg [scan2.jpg ...]
+        [--variant 3072:JPEG:90 --variant 2048:JPEG:80:gray] [--api-key KEY]
+"""
+import os
+import sys
+import time
+import difflib
+import argparse
+import tempfile
+
+from src.image_preprocess import ImagePreprocessor
+from src.gemini_api import GeminiAPI
+from src.batch import load_api_key
+
+DEFAULT_VARIANTS = ["0:PNG", "3072:JPEG:90", "2048:JPEG:85", "2048:WEBP:80", "2048:JPEG:85:gray:ac"]
+
+
+def parse_variant(text):
+    parts = text.split(':')
+    options = {"max_edge": int(parts[0]), "format": parts[1].upper()}
+    for part in parts[2:]:
+        if part == "gray":
+            options["grayscale"] = True
+        elif part == "ac":
+            options["autocontrast"] = True
+        else:
+            options["quality"] = int(part)
+    return ImagePreprocessor(**options)
+
+
+def tsv_rows(tsv_content):
+    """Text of each data row, without the bbox column."""
+    rows = []
+    for line in tsv_content.strip().splitlines()[1:]:
+        cells = line.split('\t')
+        rows.append('\t'.join(cells[1:]).strip())
+    return rows
+
+
+def accuracy(reference, candidate):
+    """Mean character similarity of aligned rows (missing or extra rows count as 0)."""
+    ref_rows, cand_rows = tsv_rows(reference), tsv_rows(candidate)
+    total = max(len(ref_rows), len(cand_rows))
+    if not total:
+        return 1.0
+    score = sum(difflib.SequenceMatcher(None, a, b).ratio() for a, b in zip(ref_rows, cand_rows))
+    return score / total
+
+
+def reference_for(image_path):
+    """Corrected TSV saved by the editor next to the image, if any."""
+    base = os.path.splitext(image_path)[0]
+    for path in (base + "_corr.tsv", base + ".tsv"):
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+    return None
+
+
+def measure_prepare(preprocessor, image_path, repeat):
+    """Returns (payload bytes, output size, best time in ms)."""
+    best = float('inf')
+    data = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data, _ = preprocessor.prepare(image_path)
+        best = min(best, time.perf_counter() - start)
+    size = preprocessor.load(image_path).size
+    return data, size, best * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Gemini upload preprocessing")
+    parser.add_argument("images", nargs='+', help="Scans to prepare")
+    parser.add_argument("--variant", action="append", help="MAX_EDGE:FORMAT[:QUALITY][:gray][:ac] (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3, help="Preparation runs per variant (best time is kept)")
+    parser.add_argument("--api-key", help="Also measure API latency and accuracy (default: $GEMINI_API_KEY or config.json)")
+    parser.add_argument("--no-api", action="store_true", help="Only measure local preparation")
+    parser.add_argument("--prompt", default="Prompt.txt", help="Prompt file")
+    args = parser.parse_args(argv)
+
+    variants = [(text, parse_variant(text)) for text in (args.variant or DEFAULT_VARIANTS)]
+
+    gemini_api = None
+    if not args.no_api:
+        api_key = args.api_key or load_api_key()
+        if api_key:
+            # Fresh cache: every variant must reach the API
+            cache_path = os.path.join(tempfile.mkdtemp(), "transcriptions.sqlite")
+            gemini_api = GeminiAPI(api_key, args.prompt, cache_path=cache_path)
+            gemini_api.configure(api_key)
+        else:
+            print("No API key: measuring local preparation only", file=sys.stderr)
+
+    print(f"{'image':<30} {'variant':<22} {'output':>11} {'prep ms':>9} {'KiB':>8} {'api s':>8} {'accuracy':>9}")
+    for image_path in args.images:
+        reference = reference_for(image_path)
+        for text, preprocessor in variants:
+            data, size, prep_ms = measure_prepare(preprocessor, image_path, args.repeat)
+            api_s, score = "", ""
+            if gemini_api:
+                gemini_api.preprocessor = preprocessor
+                start = time.perf_counter()
+                tsv_content = gemini_api.transcribe_image(image_path)
+                api_s = f"{time.perf_counter() - start:.1f}"
+                if tsv_content:
+                    if reference is None:
+                        reference = tsv_content
+                    score = f"{accuracy(reference, tsv_content):.3f}"
+                else:
+                    score = "failed"
+            print(f"{os.path.basename(image_path)[-30:]:<30} {text:<22} {size[0]:>5}x{size[1]:<5} "
+                  f"{prep_ms:>9.0f} {len(data) / 1024:>8.0f} {api_s:>8} {score:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,458 @@
+"""
+Local stand-in for the archive website, the image server and the Gemini
+API, for offline and reproducible pipeline benchmarks.
+
+The server runs in-process on 127.0.0.1. Archive and image requests reach
+it through LocalRedirectAdapter (https://host/path -> <server>/https/host/path),
+Gemini calls through GeminiAPI(endpoint=server.url).
+
+Content is synthetic by default: a register of N pages (archive pages with
+a Binocle configuration, one JSON manifest, one JPEG per page) and canned
+TSV transcriptions. A recording directory made with `record` replaces it
+with real pages, manifests, images and TSVs:
+
+    python -m benchmarks.standin_server record "https://.../daogrp/0/1" --pages 1-5 --out recording [--tsv corrected_tsvs/]
+    python -m benchmarks.standin_server serve --recording recording --port 8765
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+STANDIN_ARCHIVE_URL = "https://standin.local/ark:/00000/standin/daogrp/0/1"
+MANIFEST_URL = "https://standin.local/binocle/BIN_standin.json"
+
+TSV_HEADER = ["Bounding Box", "N° d'ordre", "DATE du DÉCÈS", "Noms", "Prénoms", "Age", "Commentaires"]
+
+
+def synthetic_jpeg(size=(2400, 3400)):
+    """A grey page with dark ruled lines, encoded as JPEG (needs Pillow)."""
+    from PIL import Image, ImageDraw
+    img = Image.new('L', size, 225)
+    draw = ImageDraw.Draw(img)
+    for y in range(200, size[1] - 100, 80):
+        draw.line([(100, y), (size[0] - 100, y)], fill=60, width=3)
+    for x in range(100, size[0], 300):
+        draw.line([(x, 200), (x, size[1] - 100)], fill=90, width=2)
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def tag_jpeg(jpeg, text):
+    """
+    Insert a JPEG comment segment after SOI: the image is unchanged but its
+    bytes (and hash) are unique, so pages are not deduplicated by the caches.
+    """
+    comment = text.encode('utf-8')
+    segment = b'\xff\xfe' + (len(comment) + 2).to_bytes(2, 'big') + comment
+    return jpeg[:2] + segment + jpeg[2:]
+
+
+def synthetic_tsv(rows, number):
+    """Canned transcription with `rows` rows whose bboxes cover the page."""
+    lines = ['\t'.join(TSV_HEADER)]
+    step = 900 // max(1, rows)
+    for i in range(rows):
+        top = 60 + i * step
+        lines.append('\t'.join([f"[{top};40;{top + step - 4};960]", str(number * 1000 + i + 1),
+                                "01/01/1880", f"NOM{i}", f"Prénom{i}", str(20 + i % 60), ""]))
+    return '\n'.join(lines) + '\n'
+
+
+class StandinServer:
+    """
+    In-process HTTP server. Use as a context manager or start()/stop().
+
+    Counters in `stats` (requests per kind, throttled, injected errors)
+    are reset by reset_stats().
+    """
+
+    def __init__(self, pages=20, latency=0.05, gemini_latency=3.0, error_rate=0.0, throttle_rpm=0,
+                 image_bandwidth=0, tsv_rows=30, image=None, recording_dir=None, port=0, seed=0):
+        """
+        Args:
+            pages (int): Pages of the synthetic register
+            latency (float): Seconds added to every archive, manifest and image response
+            gemini_latency (float): Seconds to generate a full transcription
+            error_rate (float): Probability of an injected 500 error per request
+            throttle_rpm (float): Gemini requests per minute before answering 429 (0: unlimited)
+            image_bandwidth (float): Image bytes per second per request (0: unlimited)
+            tsv_rows (int): Rows of the synthetic transcriptions
+            image (str): JPEG file served for every page (default: generated with Pillow)
+            recording_dir (str): Directory written by record(), served instead of synthetic content
+            port (int): Port to listen on, 0 for any free port
+            seed (int): Seed of the error injection
+        """
+        self.pages = pages
+        self.latency = latency
+        self.gemini_latency = gemini_latency
+        self.error_rate = error_rate
+        self.throttle_rpm = throttle_rpm
+        self.image_bandwidth = image_bandwidth
+        self.tsv_rows = tsv_rows
+        self.image_path = image
+        self.recording_dir = recording_dir
+        self.port = port
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._gemini_calls = deque()  # Timestamps of the last minute, for throttling
+        self._base_jpeg = None
+        self._images = {}
+        self._tsv_counter = 0
+        self._recording = self._load_recording()
+        self._server = None
+        self._thread = None
+        self.reset_stats()
+
+    # Lifecycle
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        handler = type('StandinHandler', (_Handler,), {'standin': self})
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="StandinServer", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {"archive": 0, "manifest": 0, "image": 0, "gemini": 0,
+                          "not_modified": 0, "throttled": 0, "errors": 0, "not_found": 0}
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    # Fault injection
+
+    def inject_error(self):
+        with self._lock:
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+            if failed:
+                self.stats["errors"] += 1
+        return failed
+
+    def throttled(self):
+        """Sliding one-minute window of accepted Gemini calls."""
+        if self.throttle_rpm <= 0:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            while self._gemini_calls and now - self._gemini_calls[0] > 60:
+                self._gemini_calls.popleft()
+            if len(self._gemini_calls) >= self.throttle_rpm:
+                self.stats["throttled"] += 1
+                return True
+            self._gemini_calls.append(now)
+            return False
+
+    # Content
+
+    def _load_recording(self):
+        if not self.recording_dir:
+            return None
+        with open(os.path.join(self.recording_dir, 'index.json'), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        tsv_dir = os.path.join(self.recording_dir, 'tsv')
+        tsvs = []
+        if os.path.isdir(tsv_dir):
+            for name in sorted(os.listdir(tsv_dir)):
+                with open(os.path.join(tsv_dir, name), 'r', encoding='utf-8') as f:
+                    tsvs.append(f.read())
+        return {"index": index, "tsvs": tsvs}
+
+    def recorded(self, url):
+        """Returns (body, content type) of a recorded URL, or None."""
+        if self._recording is None:
+            return None
+        entry = self._recording["index"].get(url)
+        if entry is None:
+            return None
+        with open(os.path.join(self.recording_dir, entry["file"]), 'rb') as f:
+            return f.read(), entry.get("content_type") or 'application/octet-stream'
+
+    def archive_page(self, page):
+        script = json.dumps({"binocle": {"source": MANIFEST_URL}}).replace('/', '\\/')
+        return (f"<html><head><title>Page {page}</title></head><body>"
+                f"<script type=\"text/javascript\">var binocle = {script};</script>"
+                f"</body></html>").encode('utf-8')
+
+    def manifest(self):
+        items = [{
+            "printable": f"https://standin.local/images/{i:05d}.jpg",
+            "classeur": {"unitid": "STANDIN/0001", "strImageBase": f"STANDIN_0001_{i:05d}"},
+        } for i in range(1, self.pages + 1)]
+        return json.dumps({"items": items}).encode('utf-8')
+
+    def page_image(self, page):
+        with self._lock:
+            image = self._images.get(page)
+            if image is None:
+                if self._base_jpeg is None:
+                    if self.image_path:
+                        with open(self.image_path, 'rb') as f:
+                            self._base_jpeg = f.read()
+                    else:
+                        self._base_jpeg = synthetic_jpeg()
+                image = self._images[page] = tag_jpeg(self._base_jpeg, f"standin page {page}")
+        return image
+
+    def transcription(self):
+        with self._lock:
+            self._tsv_counter += 1
+            number = self._tsv_counter
+        if self._recording and self._recording["tsvs"]:
+            tsvs = self._recording["tsvs"]
+            return tsvs[(number - 1) % len(tsvs)]
+        return synthetic_tsv(self.tsv_rows, number)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    standin = None  # Set on the subclass created by StandinServer.start()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type='text/plain', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _original_url(self):
+        """https://host/path?query from /https/host/path?query."""
+        match = re.match(r'^/(https?)/([^/]+)(/[^?]*)?(\?.*)?$', self.path)
+        if not match:
+            return None
+        scheme, host, path, query = match.groups()
+        return f"{scheme}://{host}{path or '/'}{query or ''}"
+
+    def do_GET(self):
+        standin = self.standin
+        url = self._original_url()
+        if url is None:
+            standin.count("not_found")
+            self._send(404, b"Not a redirected URL")
+            return
+
+        time.sleep(standin.latency)
+        if standin.inject_error():
+            self._send(500, b"Injected error")
+            return
+
+        path = urlsplit(url).path
+        recorded = standin.recorded(url)
+        page_match = re.search(r'/daogrp/\d+/(\d+)', path)
+        if recorded is not None:
+            body, content_type = recorded
+            kind = "image" if content_type.startswith('image/') else (
+                "manifest" if 'json' in content_type else "archive")
+        elif page_match:
+            kind, body, content_type = "archive", standin.archive_page(int(page_match.group(1))), 'text/html'
+        elif path.endswith('.json'):
+            kind, body, content_type = "manifest", standin.manifest(), 'application/json'
+        elif path.startswith('/images/'):
+            kind, content_type = "image", 'image/jpeg'
+            body = standin.page_image(int(re.sub(r'\D', '', os.path.basename(path)) or 0))
+        else:
+            standin.count("not_found")
+            self._send(404, b"Not found")
+            return
+        standin.count(kind)
+
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            standin.count("not_modified")
+            self._send(304, headers={'ETag': etag})
+            return
+
+        if kind != "image":
+            self._send(200, body, content_type, {'ETag': etag})
+            return
+        self._send_image(body, content_type, etag)
+
+    def _send_image(self, body, content_type, etag):
+        # Range requests, used to resume interrupted downloads
+        start = 0
+        status = 200
+        headers = {'ETag': etag, 'Accept-Ranges': 'bytes'}
+        range_match = re.match(r'bytes=(\d+)-$', self.headers.get('Range', ''))
+        if range_match and int(range_match.group(1)) < len(body):
+            start = int(range_match.group(1))
+            status = 206
+            headers['Content-Range'] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body) - start))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        bandwidth = self.standin.image_bandwidth
+        chunk_size = 64 * 1024
+        for offset in range(start, len(body), chunk_size):
+            self.wfile.write(body[offset:offset + chunk_size])
+            if bandwidth > 0:
+                time.sleep(chunk_size / bandwidth)
+
+    def do_POST(self):
+        standin = self.standin
+        match = re.match(r'^/v1beta/models/([^:/]+):(generateContent|streamGenerateContent)', self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if not match:
+            standin.count("not_found")
+            self._send(404, b"Not found")
+            return
+        standin.count("gemini")
+
+        if standin.throttled():
+            error = {"error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}}
+            self._send(429, json.dumps(error).encode('utf-8'), 'application/json')
+            return
+        if standin.inject_error():
+            error = {"error": {"code": 500, "message": "Injected error", "status": "INTERNAL"}}
+            self._send(500, json.dumps(error).encode('utf-8'), 'application/json')
+            return
+
+        tsv = standin.transcription()
+        if match.group(2) == "generateContent":
+            time.sleep(standin.gemini_latency)
+            self._send(200, json.dumps(_candidate(tsv)).encode('utf-8'), 'application/json')
+            return
+
+        # Server-sent events, a few lines per event spread over the latency
+        lines = tsv.splitlines(keepends=True)
+        events = [''.join(lines[i:i + 3]) for i in range(0, len(lines), 3)]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for text in events:
+            time.sleep(standin.gemini_latency / len(events))
+            self.wfile.write(f"data: {json.dumps(_candidate(text))}\r\n\r\n".encode('utf-8'))
+            self.wfile.flush()
+        self.close_connection = True
+
+
+def _candidate(text):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+
+
+def record(archive_url, pages, directory, tsv_dir=None):
+    """
+    Save the archive pages, the manifest and the images of a register (and
+    optionally TSVs to use as canned transcriptions) for StandinServer.
+    """
+    import requests
+    import shutil
+    from src.web_fetcher import WebFetcher, extract_binocle_url
+    from src.batch import page_url
+
+    os.makedirs(directory, exist_ok=True)
+    session = requests.Session()
+    session.headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    index = {}
+
+    def save(url):
+        response = session.get(url, timeout=120)
+        response.raise_for_status()
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(response.content)
+        index[url] = {"file": name, "content_type": response.headers.get('Content-Type', '').split(';')[0]}
+        print(f"Recorded {url} ({len(response.content) / 1024:.0f} KiB)")
+        return response.content
+
+    for page in pages:
+        content = save(page_url(archive_url, page))
+    save(extract_binocle_url(content))
+    fetcher = WebFetcher(cache_dir=os.path.join(directory, '.manifests'))
+    for offset, (image_url, _, _) in enumerate(fetcher.resolve_pages(archive_url, min(pages), max(pages))):
+        if min(pages) + offset in pages and image_url:
+            save(image_url)
+
+    if tsv_dir:
+        os.makedirs(os.path.join(directory, 'tsv'), exist_ok=True)
+        for name in sorted(os.listdir(tsv_dir)):
+            if name.endswith('.tsv'):
+                shutil.copy(os.path.join(tsv_dir, name), os.path.join(directory, 'tsv', name))
+
+    with open(os.path.join(directory, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in archive, image and Gemini server")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run the server until Ctrl+C")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--pages", type=int, default=20, help="Pages of the synthetic register")
+    serve.add_argument("--recording", help="Directory written by the record command")
+    serve.add_argument("--image", help="JPEG served for every synthetic page")
+    serve.add_argument("--latency", type=float, default=0.05)
+    serve.add_argument("--gemini-latency", type=float, default=3.0)
+    serve.add_argument("--error-rate", type=float, default=0.0)
+    serve.add_argument("--throttle-rpm", type=float, default=0)
+
+    rec = commands.add_parser("record", help="Record a register from the live archive")
+    rec.add_argument("url", help="Archive URL of any page of the register")
+    rec.add_argument("--pages", default="1-5", help="Pages to record, e.g. 1-5")
+    rec.add_argument("--out", default="recording", help="Output directory")
+    rec.add_argument("--tsv", help="Directory of TSV files to serve as transcriptions")
+
+    args = parser.parse_args(argv)
+    if args.command == "record":
+        from src.batch import parse_page_range
+        record(args.url, parse_page_range(args.pages), args.out, args.tsv)
+        return 0
+
+    server = StandinServer(args.pages, args.latency, args.gemini_latency, args.error_rate, args.throttle_rpm,
+                           image=args.image, recording_dir=args.recording, port=args.port)
+    server.start()
+    print(f"Stand-in server on {server.url} (archive URL: {STANDIN_ARCHIVE_URL})")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
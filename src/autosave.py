@@ -0,0 +1,135 @@
+"""
+Debounced background autosave worker.
+"""
+import os
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def write_atomic(path, write_fn):
+    """
+    Write a file through a temporary sibling and rename it into place,
+    so readers never see a half-written file.
+
+    Args:
+        path (str): Final file path
+        write_fn (callable): Called with the temporary path to write to
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        write_fn(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+class AutoSaver:
+    """
+    Coalesces bursts of save requests and writes on a worker thread.
+
+    schedule() is cheap and can be called after every edit: the save runs
+    once no new request arrived for `delay` seconds, or at the latest
+    `max_delay` seconds after the first pending request.
+    """
+
+    def __init__(self, snapshot_fn, write_fn, delay=1.5, max_delay=15.0):
+        """
+        Args:
+            snapshot_fn (callable): Returns a consistent copy of the data to save
+                (or None when there is nothing to save). Called on the worker thread.
+            write_fn (callable): Writes a snapshot to disk. Called on the worker thread.
+            delay (float): Quiet period in seconds before saving
+            max_delay (float): Upper bound in seconds between a first edit and its save
+        """
+        self.snapshot_fn = snapshot_fn
+        self.write_fn = write_fn
+        self.delay = delay
+        self.max_delay = max_delay
+
+        self.last_saved_at = None  # time.time() of the last successful save
+        self.last_error = None
+
+        self._cond = threading.Condition()
+        self._dirty = False
+        self._saving = False
+        self._first_request = None
+        self._last_request = None
+        self._force = False
+        self._thread = None
+
+    def schedule(self):
+        """Request a save after the debounce window."""
+        with self._cond:
+            now = time.monotonic()
+            if not self._dirty:
+                self._first_request = now
+            self._dirty = True
+            self._last_request = now
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def is_pending(self):
+        with self._cond:
+            return self._dirty or self._saving
+
+    def flush(self, timeout=None):
+        """
+        Save pending changes now and wait for the write to finish.
+
+        Args:
+            timeout (float): Maximum seconds to wait, None to wait indefinitely
+
+        Returns:
+            bool: True if nothing is left to save
+        """
+        with self._cond:
+            if not self._dirty and not self._saving:
+                return True
+            self._force = True
+            self._ensure_thread()
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._dirty and not self._saving, timeout)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="AutoSaver", daemon=True)
+            self._thread.start()
+
+    def _due_in(self):
+        if self._force:
+            return 0
+        due = min(self._last_request + self.delay, self._first_request + self.max_delay)
+        return due - time.monotonic()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._dirty)
+                remaining = self._due_in()
+                while remaining > 0:
+                    self._cond.wait(remaining)
+                    remaining = self._due_in()
+                self._dirty = False
+                self._force = False
+                self._saving = True
+
+            try:
+                snapshot = self.snapshot_fn()
+                if snapshot is not None:
+                    self.write_fn(snapshot)
+                    self.last_saved_at = time.time()
+                self.last_error = None
+            except Exception as e:
+                logger.error(f"Auto-save failed: {e}")
+                self.last_error = str(e)
+
+            with self._cond:
+                self._saving = False
+                self._cond.notify_all()
@@ -0,0 +1,163 @@
+"""
+Band-split transcription: a tall register page is cut into overlapping
+horizontal bands transcribed concurrently, then the TSV rows are stitched
+back into one page.
+"""
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+BAND_PROMPT = (
+    "\n\nThe attached image is horizontal band {index} of {count} of a register page. "
+    "Transcribe every row visible in this band, even if it is partly cut at the top or bottom, "
+    "and give the bounding boxes relative to this band image."
+)
+
+
+def split_bands(height, bands, overlap):
+    """
+    Cut [0, height) into `bands` horizontal ranges overlapping by `overlap`
+    (fraction of the page height).
+
+    Returns:
+        list: (top, bottom) pixel ranges, top to bottom
+    """
+    bands = max(1, bands)
+    step = height / bands
+    margin = overlap * height / 2
+    ranges = []
+    for i in range(bands):
+        top = max(0, int(i * step - margin))
+        bottom = min(height, int((i + 1) * step + margin + 0.5))
+        ranges.append((top, bottom))
+    return ranges
+
+
+def parse_bbox(value):
+    """Parse "[ymin;xmin;ymax;xmax]" (or comma separated). Returns 4 floats or None."""
+    parts = [p.strip() for p in re.split(r'[;,]', str(value).strip().strip('[]"')) if p.strip()]
+    if len(parts) != 4:
+        return None
+    try:
+        return [float(p) for p in parts]
+    except ValueError:
+        return None
+
+
+def _split_tsv(tsv_content):
+    """Returns (header line or None, list of row cell lists) of a TSV response."""
+    lines = [line for line in tsv_content.splitlines() if line.strip() and not line.startswith("```")]
+    if not lines:
+        return None, []
+    header = None
+    if parse_bbox(lines[0].split('\t')[0]) is None:
+        header, lines = lines[0], lines[1:]
+    return header, [line.split('\t') for line in lines]
+
+
+def stitch_bands(band_results, ranges, height):
+    """
+    Merge the TSV responses of the bands into one page TSV.
+
+    Bounding boxes are remapped from band coordinates to the 0-1000 page
+    space. A band keeps the rows centered above the middle of its overlap
+    with the next band and below the last row kept from the previous
+    bands, so a row seen by two bands is kept once, and a row the two
+    bands place on opposite sides of the middle is still kept once.
+    Rows without a usable bbox are dropped when an identical row was kept.
+
+    Args:
+        band_results (list): TSV response of each band
+        ranges (list): (top, bottom) pixel range of each band
+        height (int): Page height in pixels
+
+    Returns:
+        str: Page TSV
+    """
+    header = None
+    rows = []
+    seen = set()
+    floor = 0  # Bottom of the last row kept from the previous bands
+    for i, (tsv_content, (top, bottom)) in enumerate(zip(band_results, ranges)):
+        band_header, band_rows = _split_tsv(tsv_content or "")
+        header = header or band_header
+
+        core_bottom = height if i == len(ranges) - 1 else (bottom + ranges[i + 1][0]) / 2
+        band_height = bottom - top
+        band_floor = floor
+
+        for cells in band_rows:
+            text = '\t'.join(cell.strip() for cell in cells[1:])
+            bbox = parse_bbox(cells[0])
+            if bbox is not None:
+                ymin, xmin, ymax, xmax = bbox
+                ymin = top + ymin / 1000 * band_height
+                ymax = top + ymax / 1000 * band_height
+                center = (ymin + ymax) / 2
+                if not band_floor < center < core_bottom:
+                    continue
+                floor = max(floor, ymax)
+                page_bbox = [round(ymin / height * 1000), round(xmin), round(ymax / height * 1000), round(xmax)]
+                cells = [f"[{';'.join(map(str, page_bbox))}]"] + cells[1:]
+            elif text in seen:
+                continue
+            seen.add(text)
+            rows.append('\t'.join(cells))
+
+    lines = ([header] if header else []) + rows
+    return '\n'.join(lines) + '\n'
+
+
+class BandTranscriber:
+    """
+    Transcribes one page as `bands` concurrent API calls, so that page
+    latency is close to that of the slowest band and each response stays
+    short enough not to be truncated.
+    """
+
+    def __init__(self, gemini_api, bands=3, overlap=0.06):
+        """
+        Args:
+            gemini_api (GeminiAPI): Configured API client
+            bands (int): Number of horizontal bands
+            overlap (float): Overlap between neighbouring bands, as a fraction
+                of the page height. Should exceed a row height so that every
+                row is entirely inside the band that keeps it.
+        """
+        self.gemini_api = gemini_api
+        self.bands = bands
+        self.overlap = overlap
+
+    def signature(self):
+        """Short string identifying the options, part of the transcription cache key."""
+        return f"bands{self.bands}x{self.overlap:g}"
+
+    def transcribe(self, image_path, timeout=None):
+        """
+        Transcribe a page band by band. API errors are raised.
+
+        Returns:
+            str: Stitched page TSV, or None if a band returned nothing
+        """
+        preprocessor = self.gemini_api.preprocessor
+        img = preprocessor.load(image_path)
+        ranges = split_bands(img.height, self.bands, self.overlap)
+        parts = [preprocessor.encode(img.crop((0, top, img.width, bottom))) for top, bottom in ranges]
+        height = img.height
+        del img
+
+        def request(index):
+            data, mime_type = parts[index]
+            prompt = self.gemini_api.prompt + BAND_PROMPT.format(index=index + 1, count=len(ranges))
+            return self.gemini_api.request_tsv(prompt, data, mime_type, timeout)
+
+        logger.info(f"Transcribing {image_path} as {len(ranges)} bands")
+        with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="Band") as executor:
+            results = list(executor.map(request, range(len(ranges))))
+
+        if not all(results):
+            logger.error("A band returned no transcription")
+            return None
+        return stitch_bands(results, ranges, height)
@@ -0,0 +1,332 @@
+"""
+Headless batch pipeline: resolve, download and transcribe a range of
+register pages without the GUI.
+
+Usage:
+    python -m src.batch URL [--pages 1-300|all] [--output-dir DIR] [--workers 4]
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src.logger import setup_logging
+from src.autosave import write_atomic
+from src.web_fetcher import WebFetcher
+from src.image_downloader import ImageDownloader
+from src.gemini_api import GeminiAPI
+from src.image_preprocess import ImagePreprocessor
+from src.transcription_queue import TranscriptionQueue
+
+logger = logging.getLogger(__name__)
+
+STATE_FILENAME = "batch_state.json"
+
+
+def parse_page_range(text):
+    """
+    Parse a page selection such as "5", "1-300" or "1-10,15,20-22".
+
+    Returns:
+        list: Sorted page numbers (1-indexed)
+    """
+    pages = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            start, end = int(start), int(end)
+            if end < start:
+                raise ValueError(f"Invalid page range: {part}")
+            pages.update(range(start, end + 1))
+        else:
+            pages.add(int(part))
+    if any(p < 1 for p in pages):
+        raise ValueError("Page numbers start at 1")
+    return sorted(pages)
+
+
+def page_url(archive_url, page):
+    """
+    Build the archive URL of another page of the same register
+    (the page is the last segment of /daogrp/<n>/<page>).
+    """
+    new_url, count = re.subn(r'(/daogrp/\d+/)(\d+)', lambda m: f"{m.group(1)}{page}", archive_url, count=1)
+    if not count:
+        raise ValueError(f"Could not find the page number in URL: {archive_url}")
+    return new_url
+
+
+def url_page(archive_url):
+    """Returns the page number of an archive URL, or None."""
+    match = re.search(r'/daogrp/\d+/(\d+)', archive_url)
+    return int(match.group(1)) if match else None
+
+
+def load_api_key(config_path="config.json"):
+    """Read the Gemini API key from the environment or the GUI config file."""
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if api_key:
+        return api_key
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("api", {}).get("gemini_api_key", "")
+    except (IOError, json.JSONDecodeError):
+        return ""
+
+
+class BatchRunner:
+    """Runs the fetch -> download -> transcribe pipeline over many pages."""
+
+    def __init__(self, output_dir, api_key, prompt_file="Prompt.txt", workers=2,
+                 download_workers=4, requests_per_second=2.0, tiled=False, requests_per_minute=10,
+                 preprocessor=None, bands=1, transport=None, gemini_endpoint=None, cache_dir=None):
+        """
+        Args:
+            output_dir (str): Directory for images, TSVs and the resume state
+            api_key (str): Gemini API key
+            prompt_file (str): Path to the transcription prompt
+            workers (int): Number of pages processed concurrently
+            download_workers (int): Number of concurrent image downloads
+            requests_per_second (float): Per-host download rate limit
+            tiled (bool): Download iipsrv images as parallel tiles
+            requests_per_minute (float): Gemini API call rate limit
+            preprocessor (ImagePreprocessor): Image preparation before upload
+            bands (int): Horizontal bands transcribed in parallel per page
+            transport (requests.adapters.HTTPAdapter): Adapter for archive and image requests
+            gemini_endpoint (str): Gemini REST API root to call instead of the SDK
+            cache_dir (str): Directory for the manifest and transcription caches
+                (default: ./cache, shared with the GUI)
+        """
+        self.output_dir = output_dir
+        self.workers = max(1, workers)
+        self.download_workers = max(1, download_workers)
+        cache_dir = cache_dir or os.path.join(os.getcwd(), 'cache')
+        self.web_fetcher = WebFetcher(os.path.join(cache_dir, 'manifests'), transport=transport)
+        self.image_downloader = ImageDownloader(output_dir, requests_per_second=requests_per_second,
+                                                pool_size=self.download_workers, tiled=tiled, transport=transport)
+        self.gemini_api = GeminiAPI(api_key, prompt_file, os.path.join(cache_dir, 'transcriptions.sqlite'),
+                                    preprocessor, gemini_endpoint)
+        self.gemini_api.set_bands(bands)
+        self.transcriber = TranscriptionQueue(self.gemini_api, self.workers, requests_per_minute)
+
+        self.state_path = os.path.join(output_dir, STATE_FILENAME)
+        self.state = self._load_state()
+        self._state_lock = threading.Lock()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, json.JSONDecodeError):
+            return {"pages": {}}
+
+    def _save_state(self):
+        def write(tmp_path):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, indent=2, ensure_ascii=False)
+        write_atomic(self.state_path, write)
+
+    def _update_page(self, page, **fields):
+        with self._state_lock:
+            entry = self.state["pages"].setdefault(str(page), {})
+            entry.update(fields)
+            self._save_state()
+
+    def _page_entry(self, page):
+        with self._state_lock:
+            return dict(self.state["pages"].get(str(page), {}))
+
+    def resolve(self, archive_url, pages):
+        """
+        Resolve all pages not resolved by a previous run with one bulk lookup.
+
+        Args:
+            pages (list): Page numbers, or None for the whole register
+
+        Returns:
+            list: Page numbers to process
+        """
+        if pages is not None:
+            missing = [p for p in pages if not self._page_entry(p).get("image_url")]
+            if not missing:
+                return pages
+            first, last = min(missing), max(missing)
+        else:
+            first, last = 1, None
+
+        resolved = self.web_fetcher.resolve_pages(archive_url, first, last)
+        if pages is None:
+            pages = list(range(1, len(resolved) + 1))
+
+        with self._state_lock:
+            for offset, (image_url, cote, page_id) in enumerate(resolved):
+                page = first + offset
+                if image_url and page in pages:
+                    entry = self.state["pages"].setdefault(str(page), {})
+                    if not entry.get("image_url"):
+                        entry.update(image_url=image_url, cote=cote, page_id=page_id, status="resolved")
+            self._save_state()
+        return pages
+
+    def download(self, pages):
+        """
+        Download the images of all resolved pages concurrently.
+        """
+        pending = []
+        for page in pages:
+            entry = self._page_entry(page)
+            image_path = entry.get("image")
+            if entry.get("image_url") and not (image_path and os.path.exists(image_path)):
+                pending.append(page)
+        if not pending:
+            return
+
+        item_pages = {}
+        for page in pending:
+            entry = self._page_entry(page)
+            item_pages[(entry["image_url"], entry["cote"], entry["page_id"])] = page
+        items = list(item_pages)
+
+        def on_progress(done, total, item, path):
+            page = item_pages[item]
+            if path:
+                self._update_page(page, image=path, status="downloaded")
+            logger.info(f"[{done}/{total}] Download page {page}: {'ok' if path else 'failed'}")
+
+        logger.info(f"Downloading {len(items)} images with {self.download_workers} workers")
+        self.image_downloader.download_images(items, self.download_workers, on_progress)
+
+    def process_page(self, archive_url, page):
+        """
+        Process one page, skipping the stages already completed by a previous run.
+
+        Returns:
+            str: "done", "skipped" or "failed"
+        """
+        entry = self._page_entry(page)
+        tsv_path = entry.get("tsv")
+        if entry.get("status") == "done" and tsv_path and os.path.exists(tsv_path):
+            return "skipped"
+
+        # Resolve
+        image_url, cote, page_id = entry.get("image_url"), entry.get("cote"), entry.get("page_id")
+        if not image_url:
+            image_url, cote, page_id = self.web_fetcher.fetch_image_url(page_url(archive_url, page))
+            if not image_url:
+                self._update_page(page, status="failed", error="resolve")
+                return "failed"
+            self._update_page(page, image_url=image_url, cote=cote, page_id=page_id, status="resolved")
+
+        # Download
+        image_path = entry.get("image")
+        if not image_path or not os.path.exists(image_path):
+            image_path = self.image_downloader.download_image(image_url, cote, page_id)
+            if not image_path:
+                self._update_page(page, status="failed", error="download")
+                return "failed"
+            self._update_page(page, image=image_path, status="downloaded")
+
+        # Transcribe
+        tsv_path = self.transcriber.transcribe(image_path)
+        if not tsv_path:
+            self._update_page(page, status="failed", error="transcribe")
+            return "failed"
+        self._update_page(page, tsv=tsv_path, status="done", error=None)
+        return "done"
+
+    def run(self, archive_url, pages):
+        """
+        Process all pages with up to `workers` pages in flight.
+
+        Returns:
+            dict: Count of pages per outcome
+        """
+        summary = {"done": 0, "skipped": 0, "failed": 0}
+        total = len(pages)
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = {executor.submit(self.process_page, archive_url, page): page for page in pages}
+            for i, future in enumerate(as_completed(futures), 1):
+                page = futures[future]
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    logger.error(f"Page {page} failed: {e}")
+                    self._update_page(page, status="failed", error=str(e))
+                    outcome = "failed"
+                summary[outcome] += 1
+                logger.info(f"[{i}/{total}] Page {page}: {outcome}")
+        finally:
+            # On Ctrl+C, drop the pages not started yet; they are resumed next run
+            executor.shutdown(wait=True, cancel_futures=True)
+            self.transcriber.shutdown()
+        return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ThotIndex headless batch transcription")
+    parser.add_argument("url", help="Archive URL of any page of the register")
+    parser.add_argument("--pages", help="Pages to process, e.g. 1-300, 1-10,15 or all (default: the page of the URL)")
+    parser.add_argument("--output-dir", default="downloaded_images", help="Directory for images, TSVs and resume state")
+    parser.add_argument("--workers", type=int, default=2, help="Pages transcribed concurrently")
+    parser.add_argument("--download-workers", type=int, default=4, help="Concurrent image downloads")
+    parser.add_argument("--rate", type=float, default=2.0, help="Maximum download requests per second per host")
+    parser.add_argument("--rpm", type=float, default=10, help="Maximum Gemini requests per minute")
+    parser.add_argument("--tiled", action="store_true", help="Download large scans as parallel IIP tiles (tile requests count against --rate)")
+    parser.add_argument("--max-edge", type=int, default=3072, help="Long edge of the image sent to Gemini, 0 to keep the size")
+    parser.add_argument("--upload-format", choices=["JPEG", "WEBP", "PNG"], default="JPEG", help="Encoding of the image sent to Gemini")
+    parser.add_argument("--quality", type=int, default=90, help="JPEG/WebP quality of the image sent to Gemini")
+    parser.add_argument("--grayscale", action="store_true", help="Send grayscale images")
+    parser.add_argument("--autocontrast", action="store_true", help="Normalize contrast before sending")
+    parser.add_argument("--bands", type=int, default=1, help="Split each page into N overlapping bands transcribed in parallel")
+    parser.add_argument("--prompt", default="Prompt.txt", help="Prompt file")
+    parser.add_argument("--api-key", help="Gemini API key (default: $GEMINI_API_KEY or config.json)")
+    parser.add_argument("--log-file", default="batch.log", help="Log file")
+    args = parser.parse_args(argv)
+
+    setup_logging(args.log_file)
+
+    api_key = args.api_key or load_api_key()
+    if not api_key:
+        logger.error("No Gemini API key: use --api-key, $GEMINI_API_KEY or config.json")
+        return 2
+
+    try:
+        if args.pages == "all":
+            pages = None
+        elif args.pages:
+            pages = parse_page_range(args.pages)
+        else:
+            page = url_page(args.url)
+            if page is None:
+                raise ValueError(f"Could not find the page number in URL: {args.url}")
+            pages = [page]
+    except ValueError as e:
+        logger.error(str(e))
+        return 2
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    preprocessor = ImagePreprocessor(args.max_edge, args.grayscale, args.autocontrast, args.upload_format, args.quality)
+    runner = BatchRunner(args.output_dir, api_key, args.prompt, args.workers,
+                         args.download_workers, args.rate, args.tiled, args.rpm, preprocessor,
+                         args.bands)
+    pages = runner.resolve(args.url, pages)
+    if not pages:
+        # --pages all and the register could not be resolved: not a successful empty run
+        logger.error(f"Could not resolve the pages of {args.url}")
+        return 1
+    runner.download(pages)
+    summary = runner.run(args.url, pages)
+    logger.info(f"Batch complete: {summary['done']} done, {summary['skipped']} skipped, {summary['failed']} failed")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
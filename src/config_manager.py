@@ -53,11 +53,19 @@ class ConfigManager:
             "ui": {
                 "pan_step": 50,
                 "zoom_factor": 1.2,
-                "bbox_resize_margin": 10
+                "bbox_resize_margin": 10,
+                "autosave_delay_ms": 1500,
+                "tile_cache_mb": 256
             },
             "api": {
                 "gemini_api_key": "",
-                "download_directory": "downloaded_images"
+                "download_directory": "downloaded_images",
+                "upload_max_edge": 3072,
+                "upload_format": "JPEG",
+                "upload_quality": 90,
+                "upload_grayscale": False,
+                "upload_autocontrast": False,
+                "transcription_bands": 1
             }
         }
     
@@ -172,6 +180,42 @@ class ConfigManager:
         self.config["api"]["download_directory"] = directory
         self.save_config()
     
+    def get_upload_options(self):
+        """Get image preprocessing options for Gemini uploads, as ImagePreprocessor arguments."""
+        api = self.config.get("api", {})
+        default = self.get_default_config()["api"]
+        return {
+            "max_edge": api.get("upload_max_edge", default["upload_max_edge"]),
+            "grayscale": api.get("upload_grayscale", default["upload_grayscale"]),
+            "autocontrast": api.get("upload_autocontrast", default["upload_autocontrast"]),
+            "format": api.get("upload_format", default["upload_format"]),
+            "quality": api.get("upload_quality", default["upload_quality"])
+        }
+    
+    def set_upload_options(self, max_edge, grayscale, autocontrast, format, quality):
+        """Set image preprocessing options for Gemini uploads."""
+        if "api" not in self.config:
+            self.config["api"] = {}
+        self.config["api"].update({
+            "upload_max_edge": max_edge,
+            "upload_grayscale": grayscale,
+            "upload_autocontrast": autocontrast,
+            "upload_format": format,
+            "upload_quality": quality
+        })
+        self.save_config()
+    
+    def get_transcription_bands(self):
+        """Get the number of horizontal bands a page is split into for transcription."""
+        return self.config.get("api", {}).get("transcription_bands", 1)
+    
+    def set_transcription_bands(self, bands):
+        """Set the number of horizontal bands a page is split into for transcription."""
+        if "api" not in self.config:
+            self.config["api"] = {}
+        self.config["api"]["transcription_bands"] = bands
+        self.save_config()
+    
     def reset_to_defaults(self):
         """Reset configuration to defaults."""
         self.config = self.get_default_config()
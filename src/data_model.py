@@ -1,19 +1,46 @@
-import pandas as pd
+import numpy as np
 import logging
 import os
+import re
+import json
+import threading
+
+from src.edit_history import EditHistory, CellEdit, RowAppend
+from src.edit_journal import EditJournal
+from src.autosave import AutoSaver, write_atomic
+
+# pandas is imported by the methods that need it: it is the slowest import
+# of the application and is not needed until a TSV is opened
 
 class DataModel:
     def __init__(self):
         self.df = None
         self.original_df = None # For diff
+        self.modified_mask = None # Boolean array (rows x cols), True where df differs from original_df
         self.filepath = None
         self.corr_filepath = None
         self.bbox_col_index = 0 
+        # Parsed BBox column: (rows x 4) int array [ymin, xmin, ymax, xmax] and validity per row
+        self.bbox_array = np.zeros((0, 4), dtype=np.int32)
+        self.bbox_valid = np.zeros(0, dtype=bool)
         self.logger = logging.getLogger(__name__)
         
-        # Undo Stack
-        self.undo_stack = [] # List of deep copies of df
-        self.max_undo = 50
+        # Undo/Redo history (records only changed cells)
+        self.history = EditHistory()
+        
+        # Write-ahead journal of edits, compacted into _corr.tsv in the background
+        self.journal = None
+        self._lock = threading.RLock() # Guards df between GUI edits and the save worker
+        self.autosaver = AutoSaver(self._snapshot, self._write_snapshot)
+        
+        # Objects notified of changes (see add_listener)
+        self.listeners = []
+        self._loading = False
+        
+        # True while rows of a TSV being generated are appended (see begin_stream)
+        self.streaming = False
+        # True when that stream stopped before the end: the table is partial
+        self.stream_incomplete = False
         
         # Column Centers (0.0 to 1.0)
         self.column_centers = {} # col_index -> float
@@ -23,6 +50,15 @@ class DataModel:
         self.tsv_filepath = None
 
     def load_data(self, filepath):
+        import pandas as pd
+        # Materialize pending edits of the previous file
+        self.close()
+        
+        self._notify("model_about_to_be_reset")
+        self._loading = True
+        self.streaming = False
+        self.stream_incomplete = False
+        
         self.filepath = filepath
         self.tsv_filepath = filepath  # Store the TSV filepath
         base, ext = os.path.splitext(filepath)
@@ -41,6 +77,19 @@ class DataModel:
             
             self.logger.info(f"Loaded TSV with shape {self.df.shape}")
             
+            # Replay edits that were journaled but not compacted (crash recovery)
+            self.modified_mask = None
+            self.bbox_array = None
+            self.journal = EditJournal(self.corr_filepath + ".journal")
+            records = self.journal.read_records()
+            if records:
+                self.logger.warning(f"Replaying {len(records)} uncompacted journal records")
+                for record in records:
+                    self._apply_record(record)
+            
+            self._build_modified_mask()
+            self._build_bbox_cache()
+            
             # Validate first column
             if not self.df.empty:
                 first_val = str(self.df.iloc[0, 0]).strip('"').strip("\' ")
@@ -48,42 +97,133 @@ class DataModel:
                     self.logger.warning(f"First column does not look like BBox data: {first_val}")
             
             # Init column centers
-            config_path = filepath + ".json"
-            if os.path.exists(config_path):
-                try:
-                    import json
-                    with open(config_path, 'r') as f:
-                        loaded_config = json.load(f)
-                    
-                    # Handle both old format (dict) and new format (dict with nested structure)
-                    if isinstance(loaded_config, dict):
-                        if "column_centers" in loaded_config:
-                            # New format
-                            self.column_centers = {int(k): v for k, v in loaded_config.get("column_centers", {}).items()}
-                            # We don't load image_filename here since it's set when image is loaded
-                        else:
-                            # Old format - just column centers
-                            self.column_centers = {int(k): v for k, v in loaded_config.items()}
-                    
-                    self.logger.info(f"Loaded config from {config_path}")
-                except Exception as e:
-                    self.logger.error(f"Failed to load config: {e}")
-                    # Fallback to default
-                    num_cols = len(self.df.columns)
-                    for i in range(num_cols):
-                        self.column_centers[i] = (i + 0.5) / num_cols
-            else:
-                # Default (equally spaced)
-                num_cols = len(self.df.columns)
-                for i in range(num_cols):
-                    self.column_centers[i] = (i + 0.5) / num_cols
+            self._load_column_centers(filepath)
                 
-            # Push initial state
-            self.push_undo()
+            # Fresh history for the newly loaded file
+            self.history.clear()
+            
+            if records:
+                self.compact()
             
         except Exception as e:
             self.logger.error(f"Failed to load TSV: {e}")
             raise
+        finally:
+            self._loading = False
+            self._notify("model_reset")
+
+    def _load_column_centers(self, filepath):
+        config_path = filepath + ".json"
+        if os.path.exists(config_path):
+            try:
+                with open(config_path, 'r') as f:
+                    loaded_config = json.load(f)
+                
+                # Handle both old format (dict) and new format (dict with nested structure)
+                if isinstance(loaded_config, dict):
+                    if "column_centers" in loaded_config:
+                        # New format
+                        self.column_centers = {int(k): v for k, v in loaded_config.get("column_centers", {}).items()}
+                        # We don't load image_filename here since it's set when image is loaded
+                    else:
+                        # Old format - just column centers
+                        self.column_centers = {int(k): v for k, v in loaded_config.items()}
+                
+                self.logger.info(f"Loaded config from {config_path}")
+            except Exception as e:
+                self.logger.error(f"Failed to load config: {e}")
+                # Fallback to default
+                num_cols = len(self.df.columns)
+                for i in range(num_cols):
+                    self.column_centers[i] = (i + 0.5) / num_cols
+        else:
+            # Default (equally spaced)
+            num_cols = len(self.df.columns)
+            for i in range(num_cols):
+                self.column_centers[i] = (i + 0.5) / num_cols
+
+    def begin_stream(self, filepath, columns):
+        """
+        Opens an empty table for a TSV that is still being generated; rows
+        are added with append_streamed_rows() as they arrive and can be
+        edited meanwhile.
+        Returns False without opening anything when corrections of that
+        file exist: they are loaded with load_data() once the TSV is complete.
+        """
+        import pandas as pd
+        base, ext = os.path.splitext(filepath)
+        corr_filepath = f"{base}_corr{ext}"
+        journal = EditJournal(corr_filepath + ".journal")
+        if os.path.exists(corr_filepath) or journal.read_records():
+            return False
+        
+        self.close()
+        self._notify("model_about_to_be_reset")
+        try:
+            self.filepath = filepath
+            self.tsv_filepath = filepath
+            self.corr_filepath = corr_filepath
+            self.journal = journal
+            self.df = pd.DataFrame(columns=columns, dtype=object)
+            self.original_df = self.df.copy()
+            self._build_modified_mask()
+            self._build_bbox_cache()
+            self._load_column_centers(filepath)
+            self.history.clear()
+            self.streaming = True
+            self.stream_incomplete = False
+            self.logger.info(f"Streaming TSV into {filepath}")
+        finally:
+            self._notify("model_reset")
+        return True
+
+    def append_streamed_rows(self, rows):
+        """
+        Appends rows received from the transcription (lists of cell strings).
+        They are source rows, like those read from the TSV: not modified,
+        not journaled and not undoable.
+        """
+        import pandas as pd
+        if not self.streaming or not rows:
+            return
+        width = len(self.df.columns)
+        rows = [(list(row) + [""] * width)[:width] for row in rows]
+        
+        with self._lock:
+            first = len(self.df)
+            last = first + len(rows) - 1
+            self._notify("rows_about_to_be_inserted", first, last)
+            new_rows = pd.DataFrame(rows, columns=self.df.columns, dtype=object)
+            if first:
+                self.df = pd.concat([self.df, new_rows], ignore_index=True)
+                self.original_df = pd.concat([self.original_df, new_rows], ignore_index=True)
+            else:
+                self.df = new_rows
+                self.original_df = new_rows.copy()
+            self.modified_mask = np.vstack([self.modified_mask, np.zeros((len(rows), width), dtype=bool)])
+            self.bbox_array = np.vstack([self.bbox_array, np.zeros((len(rows), 4), dtype=np.int32)])
+            self.bbox_valid = np.append(self.bbox_valid, np.zeros(len(rows), dtype=bool))
+            for offset, row in enumerate(rows):
+                self._set_cached_bbox(first + offset, row[self.bbox_col_index])
+            self._notify("rows_inserted", first, last)
+
+    def end_stream(self, completed=True):
+        """
+        Called when the transcription is complete, failed or was cancelled.
+        _corr.tsv is not written while streaming: edits stay in the journal.
+        Once complete they are materialized with all the rows. Otherwise the
+        partial table is never saved, and the journal is replayed onto the
+        full TSV when the page is loaded again.
+        """
+        if not self.streaming:
+            return
+        self.streaming = False
+        if not completed:
+            self.stream_incomplete = True
+            if self.journal is not None and self.journal.pending:
+                self.logger.info(f"Transcription stopped: {self.journal.pending} edits kept in the journal")
+        elif self.journal is not None and self.journal.pending:
+            self.auto_save()
 
     def update_column_center(self, col_index, new_val):
         """
@@ -126,46 +266,208 @@ class DataModel:
                 center = new_val + (i + 0.5) * chunk
                 self.column_centers[target_col] = center
 
-    def push_undo(self):
-        if self.df is not None:
-            if len(self.undo_stack) >= self.max_undo:
-                self.undo_stack.pop(0)
-            self.undo_stack.append(self.df.copy())
-
     def undo(self):
-        if len(self.undo_stack) > 1:
-            self.undo_stack.pop() # Pop current state
-            self.df = self.undo_stack[-1].copy() # Revert to previous
-            self.auto_save()
-            return True
-        return False
+        command = self.history.pop_undo()
+        if command is None:
+            return False
+        command.undo(self)
+        self.auto_save()
+        return True
+
+    def redo(self):
+        command = self.history.pop_redo()
+        if command is None:
+            return False
+        command.redo(self)
+        self.auto_save()
+        return True
+
+    def _set_cell(self, row, col, value):
+        import pandas as pd
+        if not isinstance(value, str) and pd.isna(value):
+            value = None
+        self._record({"op": "cell", "row": row, "col": col, "value": value})
+
+    def _append_row(self, values):
+        self._record({"op": "add_row", "row": len(self.df), "values": list(values)})
+
+    def _drop_last_row(self):
+        self._record({"op": "drop_last_row", "row": len(self.df) - 1})
+
+    def _record(self, record):
+        """
+        Applies an edit record to df and appends it to the journal.
+        """
+        with self._lock:
+            self._apply_record(record)
+            if self.journal is not None:
+                self.journal.append(record)
+
+    def _apply_record(self, record):
+        import pandas as pd
+        op = record.get("op")
+        if op == "cell":
+            row, col = record["row"], record["col"]
+            if row >= len(self.df) or col >= len(self.df.columns):
+                self.logger.warning(f"Skipping out-of-range journal record: {record}")
+                return
+            self.df.iloc[row, col] = record["value"]
+            if self.modified_mask is not None:
+                self.modified_mask[row, col] = self._compare_cell(row, col)
+            if self.bbox_array is not None and col == self.bbox_col_index:
+                self._set_cached_bbox(row, record["value"])
+            self._notify("cells_changed", row, col, row, col)
+        elif op == "add_row":
+            # Row ops carry their index so that replaying a segment already
+            # contained in the TSV (crash during compaction) is a no-op
+            if record.get("row", len(self.df)) != len(self.df):
+                return
+            new_index = len(self.df)
+            self._notify("rows_about_to_be_inserted", new_index, new_index)
+            new_row = dict(zip(self.df.columns, record["values"]))
+            self.df = pd.concat([self.df, pd.DataFrame([new_row])], ignore_index=True)
+            if self.modified_mask is not None:
+                new_mask = np.ones((1, self.modified_mask.shape[1]), dtype=bool)
+                self.modified_mask = np.vstack([self.modified_mask, new_mask])
+            if self.bbox_array is not None:
+                self.bbox_array = np.vstack([self.bbox_array, np.zeros((1, 4), dtype=np.int32)])
+                self.bbox_valid = np.append(self.bbox_valid, False)
+                self._set_cached_bbox(len(self.df) - 1, record["values"][self.bbox_col_index])
+            self._notify("rows_inserted", new_index, new_index)
+        elif op == "drop_last_row":
+            if record.get("row", len(self.df) - 1) != len(self.df) - 1:
+                return
+            last_index = len(self.df) - 1
+            self._notify("rows_about_to_be_removed", last_index, last_index)
+            self.df = self.df.iloc[:-1].copy()
+            if self.modified_mask is not None:
+                self.modified_mask = self.modified_mask[:-1].copy()
+            if self.bbox_array is not None:
+                self.bbox_array = self.bbox_array[:-1].copy()
+                self.bbox_valid = self.bbox_valid[:-1].copy()
+            self._notify("rows_removed", last_index, last_index)
+        else:
+            self.logger.warning(f"Unknown journal record: {record}")
+
+    def add_listener(self, listener):
+        """
+        Registers an object notified of changes. A listener implements any of:
+            cells_changed(top, left, bottom, right)  (inclusive range)
+            rows_about_to_be_inserted(first, last) / rows_inserted(first, last)
+            rows_about_to_be_removed(first, last) / rows_removed(first, last)
+            model_about_to_be_reset() / model_reset()
+        """
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _notify(self, event, *args):
+        # Individual edits are not reported while a file is being loaded/replayed;
+        # listeners get a single model_reset instead
+        if self._loading and not event.startswith("model_"):
+            return
+        for listener in list(self.listeners):
+            handler = getattr(listener, event, None)
+            if handler is not None:
+                handler(*args)
+
+    def _edit_cells(self, changes):
+        """
+        Applies [(row, col, new_value), ...] and records the old values for undo.
+        """
+        recorded = []
+        for row, col, new_value in changes:
+            old_value = self.df.iloc[row, col]
+            self._set_cell(row, col, new_value)
+            recorded.append((row, col, old_value, new_value))
+        self.history.push(CellEdit(recorded))
+
+    def _config_data(self):
+        return {
+            "column_centers": dict(self.column_centers),
+            "image_filename": os.path.basename(self.image_filepath) if self.image_filepath else None,
+            "tsv_filename": os.path.basename(self.tsv_filepath) if self.tsv_filepath else None
+        }
+
+    def _write_config(self, config_path, config_data):
+        def write(tmp_path):
+            with open(tmp_path, 'w') as f:
+                json.dump(config_data, f, indent=2)
+        write_atomic(config_path, write)
+        self.logger.info(f"Saved config to {config_path}")
 
     def save_config(self):
         if not self.filepath:
             return
         
-        config_path = self.filepath + ".json"
         try:
-            import json
-            config_data = {
-                "column_centers": self.column_centers,
-                "image_filename": os.path.basename(self.image_filepath) if self.image_filepath else None,
-                "tsv_filename": os.path.basename(self.tsv_filepath) if self.tsv_filepath else None
-            }
-            with open(config_path, 'w') as f:
-                json.dump(config_data, f, indent=2)
-            self.logger.info(f"Saved config to {config_path}")
+            self._write_config(self.filepath + ".json", self._config_data())
         except Exception as e:
             self.logger.error(f"Failed to save config: {e}")
 
     def auto_save(self):
-        if self.corr_filepath and self.df is not None:
-            try:
-                self.df.to_csv(self.corr_filepath, sep='\t', index=False)
-                self.logger.info(f"Auto-saved to {self.corr_filepath}")
-                self.save_config() # Save config as well
-            except Exception as e:
-                self.logger.error(f"Auto-save failed: {e}")
+        """
+        Called after each edit. Edits are already durable in the journal;
+        the TSV rewrite is debounced and runs on the autosave worker.
+        """
+        self.autosaver.schedule()
+
+    def _snapshot(self):
+        """
+        Runs on the autosave worker: copies the state to write and moves the
+        journal records it contains to the compacting segment.
+        """
+        with self._lock:
+            if not self.corr_filepath or self.df is None:
+                return None
+            if self.streaming or self.stream_incomplete:
+                # Partial table: a _corr.tsv would hide the rows still to come
+                return None
+            if self.journal is not None:
+                self.journal.rotate()
+            return {
+                "df": self.df.copy(),
+                "corr_filepath": self.corr_filepath,
+                "config_path": self.filepath + ".json",
+                "config_data": self._config_data(),
+                "journal": self.journal,
+            }
+
+    def _write_snapshot(self, snapshot):
+        """
+        Runs on the autosave worker: writes the snapshot atomically.
+        """
+        corr_filepath = snapshot["corr_filepath"]
+        write_atomic(corr_filepath, lambda tmp_path: snapshot["df"].to_csv(tmp_path, sep='\t', index=False))
+        self.logger.info(f"Auto-saved to {corr_filepath}")
+        self._write_config(snapshot["config_path"], snapshot["config_data"])
+        if snapshot["journal"] is not None:
+            snapshot["journal"].commit_rotation()
+
+    def compact(self):
+        """
+        Materializes the current state into _corr.tsv now and waits for it.
+        """
+        self.autosaver.schedule()
+        self.autosaver.flush()
+
+    def save_status(self):
+        """
+        Returns (last_saved_at, pending, last_error) for status display.
+        last_saved_at is a time.time() timestamp or None.
+        """
+        return self.autosaver.last_saved_at, self.autosaver.is_pending(), self.autosaver.last_error
+
+    def close(self):
+        """
+        Flushes pending saves and releases the journal file.
+        """
+        if self.journal is not None:
+            self.autosaver.flush()
+            self.journal.close()
 
     def save_data(self, filepath=None):
         # Manual save might overwrite original or just trigger auto-save
@@ -175,10 +477,40 @@ class DataModel:
         # "keep the same name and add _corr" implies we work on _corr.
         # Let's assume manual save also updates _corr, or maybe updates original?
         # Usually manual save commits changes. Let's stick to _corr for safety as requested.
-        self.auto_save()
+        self.compact()
+
+    @staticmethod
+    def _normalized_strings(frame):
+        """
+        Returns frame as stripped strings with NaN as "", for comparisons.
+        """
+        frame = frame.astype(object).where(frame.notna(), "")
+        return frame.astype(str).apply(lambda col: col.str.strip())
+
+    def _build_modified_mask(self):
+        """
+        Computes modified_mask with one vectorized comparison of df against original_df.
+        """
+        rows, cols = self.df.shape
+        self.modified_mask = np.ones((rows, cols), dtype=bool)
+        if self.original_df is None:
+            return
+        
+        # Rows/columns missing from the original stay marked as modified
+        common_rows = min(rows, len(self.original_df))
+        common_cols = min(cols, len(self.original_df.columns))
+        curr = self._normalized_strings(self.df.iloc[:common_rows, :common_cols]).to_numpy()
+        orig = self._normalized_strings(self.original_df.iloc[:common_rows, :common_cols]).to_numpy()
+        self.modified_mask[:common_rows, :common_cols] = curr != orig
 
     def is_modified(self, row, col):
-        if self.original_df is None or row >= len(self.original_df):
+        if self.modified_mask is not None and row < self.modified_mask.shape[0] and col < self.modified_mask.shape[1]:
+            return bool(self.modified_mask[row, col])
+        return self._compare_cell(row, col)
+
+    def _compare_cell(self, row, col):
+        import pandas as pd
+        if self.original_df is None or row >= len(self.original_df) or col >= len(self.original_df.columns):
             return True # New row is modified
         
         val_curr = self.df.iloc[row, col]
@@ -194,27 +526,57 @@ class DataModel:
         
         return str_curr != str_orig
 
-    def get_bbox(self, row_index):
+    def _parse_bbox(self, value):
         """
-        Returns BBox coordinates [ymin, xmin, ymax, xmax] for a given row.
+        Parses a "[ymin;xmin;ymax;xmax]" string. Returns a list of 4 ints or None.
         """
-        if self.df is None or row_index >= len(self.df):
-            return None
-        
-        bbox_str = str(self.df.iloc[row_index, 0])
+        bbox_str = str(value)
         try:
             # Remove brackets and split
             content = bbox_str.strip('[]"') # Also strip quotes if present
-            import re
             parts = re.split(r'[;,]', content)
             parts = [p.strip() for p in parts if p.strip()]
             if len(parts) != 4:
                 return None
             return [int(float(p)) for p in parts]
         except ValueError:
-            self.logger.error(f"Invalid BBox format at row {row_index}: {bbox_str}")
+            self.logger.error(f"Invalid BBox format: {bbox_str}")
             return None
 
+    def _build_bbox_cache(self):
+        """
+        Parses the whole BBox column once into bbox_array/bbox_valid.
+        """
+        rows = len(self.df)
+        self.bbox_array = np.zeros((rows, 4), dtype=np.int32)
+        self.bbox_valid = np.zeros(rows, dtype=bool)
+        if rows == 0 or self.bbox_col_index >= len(self.df.columns):
+            return
+        for row, value in enumerate(self.df.iloc[:, self.bbox_col_index].tolist()):
+            self._set_cached_bbox(row, value)
+
+    def _set_cached_bbox(self, row, value):
+        bbox = self._parse_bbox(value)
+        if bbox is None:
+            self.bbox_valid[row] = False
+        else:
+            self.bbox_array[row] = bbox
+            self.bbox_valid[row] = True
+
+    def get_bbox(self, row_index):
+        """
+        Returns BBox coordinates [ymin, xmin, ymax, xmax] for a given row.
+        """
+        if self.bbox_array is None or row_index >= len(self.bbox_valid) or not self.bbox_valid[row_index]:
+            return None
+        return self.bbox_array[row_index].tolist()
+
+    def get_bboxes(self):
+        """
+        Returns (bbox_array, bbox_valid) for bulk access. Do not modify them.
+        """
+        return self.bbox_array, self.bbox_valid
+
     def update_bbox(self, row_index, bbox_coords):
         """
         Updates the BBox for a row. bbox_coords = [ymin, xmin, ymax, xmax]
@@ -222,15 +584,13 @@ class DataModel:
         if self.df is None or row_index >= len(self.df):
             return
         
-        self.push_undo()
         bbox_str = f"[{';'.join(map(str, bbox_coords))}]"
-        self.df.iloc[row_index, 0] = bbox_str
+        self._edit_cells([(row_index, 0, bbox_str)])
         self.logger.debug(f"Updated row {row_index} bbox to {bbox_str}")
         self.auto_save()
 
     def update_cell(self, row, col, value):
-        self.push_undo()
-        self.df.iloc[row, col] = value
+        self._edit_cells([(row, col, value)])
         self.auto_save()
 
     def revert_cell(self, row, col):
@@ -242,9 +602,8 @@ class DataModel:
             self.logger.warning(f"Cannot revert cell ({row}, {col}): no original data")
             return False
         
-        self.push_undo()
         original_value = self.original_df.iloc[row, col]
-        self.df.iloc[row, col] = original_value
+        self._edit_cells([(row, col, original_value)])
         self.logger.info(f"Reverted cell ({row}, {col}) to original value")
         self.auto_save()
         return True
@@ -252,13 +611,18 @@ class DataModel:
     def add_row(self, bbox_coords):
         """
         Adds a new row with the given BBox. Fills other columns with empty strings.
+        Returns the row index, or None while the table is streaming or partial.
         """
-        self.push_undo()
+        if self.streaming or self.stream_incomplete:
+            # Rows still arriving would be misaligned with the original
+            self.logger.warning("Cannot add a row to an incomplete transcription")
+            return None
+        
         bbox_str = f"[{';'.join(map(str, bbox_coords))}]"
-        new_row = {col: "" for col in self.df.columns}
-        new_row[self.df.columns[0]] = bbox_str
+        values = [bbox_str] + [""] * (len(self.df.columns) - 1)
         
-        self.df = pd.concat([self.df, pd.DataFrame([new_row])], ignore_index=True)
+        self._append_row(values)
+        self.history.push(RowAppend(len(self.df) - 1, values))
         self.logger.info(f"Added new row. Total rows: {len(self.df)}")
         self.auto_save()
         return len(self.df) - 1
@@ -0,0 +1,124 @@
+"""
+Delta-based undo/redo history for DataModel edits.
+"""
+import sys
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Fixed per-entry overhead (tuple, references, command object) used when
+# estimating the memory held by the history.
+ENTRY_OVERHEAD = 64
+
+
+def _value_size(value):
+    try:
+        return sys.getsizeof(value)
+    except TypeError:
+        return ENTRY_OVERHEAD
+
+
+class CellEdit:
+    """
+    One or more cell changes recorded as (row, col, old_value, new_value).
+    """
+
+    def __init__(self, changes):
+        self.changes = list(changes)
+
+    def undo(self, model):
+        for row, col, old_value, _ in reversed(self.changes):
+            model._set_cell(row, col, old_value)
+
+    def redo(self, model):
+        for row, col, _, new_value in self.changes:
+            model._set_cell(row, col, new_value)
+
+    def cells(self):
+        """Returns the list of (row, col) touched by this edit."""
+        return [(row, col) for row, col, _, _ in self.changes]
+
+    def size_bytes(self):
+        return sum(ENTRY_OVERHEAD + _value_size(old) + _value_size(new)
+                   for _, _, old, new in self.changes)
+
+
+class RowAppend:
+    """
+    A row appended at the end of the table, with its values.
+    """
+
+    def __init__(self, row_index, values):
+        self.row_index = row_index
+        self.values = list(values)
+
+    def undo(self, model):
+        model._drop_last_row()
+
+    def redo(self, model):
+        model._append_row(self.values)
+
+    def cells(self):
+        return [(self.row_index, col) for col in range(len(self.values))]
+
+    def size_bytes(self):
+        return ENTRY_OVERHEAD + sum(_value_size(v) for v in self.values)
+
+
+class EditHistory:
+    """
+    Undo/redo log of edit commands, bounded by an estimated memory budget.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        """
+        Args:
+            max_bytes (int): Approximate memory budget for recorded edits.
+                The oldest edits are dropped once it is exceeded.
+        """
+        self.max_bytes = max_bytes
+        self.undo_stack = []
+        self.redo_stack = []
+        self.total_bytes = 0
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.total_bytes = 0
+
+    def push(self, command):
+        """Records a command that has already been applied."""
+        self.redo_stack.clear()
+        size = command.size_bytes()
+        self.undo_stack.append((command, size))
+        self.total_bytes += size
+
+        # Always keep at least the latest command
+        while self.total_bytes > self.max_bytes and len(self.undo_stack) > 1:
+            _, size = self.undo_stack.pop(0)
+            self.total_bytes -= size
+            logger.debug("Dropped oldest undo entry to stay within memory budget")
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def pop_undo(self):
+        """Moves the latest command to the redo stack and returns it (or None)."""
+        if not self.undo_stack:
+            return None
+        command, size = self.undo_stack.pop()
+        self.total_bytes -= size
+        self.redo_stack.append((command, size))
+        return command
+
+    def pop_redo(self):
+        """Moves the latest undone command back to the undo stack and returns it (or None)."""
+        if not self.redo_stack:
+            return None
+        command, size = self.redo_stack.pop()
+        self.undo_stack.append((command, size))
+        self.total_bytes += size
+        return command
@@ -0,0 +1,139 @@
+"""
+Append-only write-ahead journal of DataModel edits.
+"""
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    # NumPy scalars coming from pandas cells
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class EditJournal:
+    """
+    Stores one JSON line per edit next to the correction TSV.
+
+    Records are replayed on top of the last compacted TSV when a file is
+    reopened after a crash, then the journal is reset by compaction.
+
+    Background compaction uses rotate()/commit_rotation(): records present
+    at snapshot time move to a ".compacting" segment that is deleted once
+    the TSV is written, while new edits keep going to the live journal.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path of the journal file
+        """
+        self.path = path
+        self.compacting_path = path + ".compacting"
+        self.pending = 0  # Records written since the last compaction
+        self._file = None
+
+    def read_records(self):
+        """
+        Read all complete records from the journal.
+
+        Returns:
+            list: Decoded records, in write order
+        """
+        records = []
+        # Older segment first: it was being compacted when the app stopped
+        for path in (self.compacting_path, self.path):
+            if os.path.exists(path):
+                records.extend(self._read_file(path))
+
+        self.pending = len(records)
+        return records
+
+    def _read_file(self, path):
+        records = []
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Torn write at the tail (crash mid-append)
+                        logger.warning(f"Ignoring truncated journal record in {path}")
+                        break
+        except IOError as e:
+            logger.error(f"Failed to read journal {path}: {e}")
+        return records
+
+    def append(self, record):
+        """
+        Append a record and make it durable.
+
+        Args:
+            record (dict): JSON-serializable edit record
+        """
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(record, ensure_ascii=False, default=_json_default) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.pending += 1
+        except (IOError, OSError) as e:
+            logger.error(f"Failed to append to journal {self.path}: {e}")
+
+    def rotate(self):
+        """
+        Move the current records to the compacting segment. Must be called
+        while no append can happen (the caller holds the data lock).
+        """
+        self.close()
+        if not os.path.exists(self.path):
+            return
+        try:
+            if os.path.exists(self.compacting_path):
+                # A previous compaction failed: keep its records, append ours
+                with open(self.path, 'r', encoding='utf-8') as src, \
+                        open(self.compacting_path, 'a', encoding='utf-8') as dst:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.compacting_path)
+            self.pending = 0
+        except (IOError, OSError) as e:
+            logger.error(f"Failed to rotate journal {self.path}: {e}")
+
+    def commit_rotation(self):
+        """Discard the compacting segment once its records are in the TSV."""
+        try:
+            if os.path.exists(self.compacting_path):
+                os.remove(self.compacting_path)
+        except OSError as e:
+            logger.error(f"Failed to remove journal segment {self.compacting_path}: {e}")
+
+    def reset(self):
+        """Discard all records once they are materialized in the TSV."""
+        self.close()
+        for path in (self.compacting_path, self.path):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                logger.error(f"Failed to reset journal {path}: {e}")
+        self.pending = 0
+
+    def close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except (IOError, OSError) as e:
+                logger.error(f"Failed to close journal {self.path}: {e}")
+            self._file = None
@@ -4,27 +4,49 @@ Module to interact with Google Gemini API for image transcription.
 import os
 import logging
 from pathlib import Path
-import google.generativeai as genai
-from PIL import Image
+
+from src.image_cache import file_sha256
+from src.image_preprocess import ImagePreprocessor
+from src.band_transcription import BandTranscriber
+from src.transcription_cache import TranscriptionCache, transcription_key
 
 logger = logging.getLogger(__name__)
 
+MODEL_NAME = 'gemini-3-pro-preview'
+
+
+def _tsv_lines(text):
+    """Non-empty lines of a TSV response, without Markdown code fences."""
+    return [line.rstrip('\r') for line in text.split('\n') if line.strip() and not line.startswith("```")]
+
 
 class GeminiAPI:
     """Handles communication with Google Gemini API."""
     
-    def __init__(self, api_key=None, prompt_file="Prompt.txt"):
+    def __init__(self, api_key=None, prompt_file="Prompt.txt", cache_path=None, preprocessor=None, endpoint=None):
         """
         Initialize the Gemini API client.
         
         Args:
             api_key (str): Google Gemini API key
             prompt_file (str): Path to the prompt file
+            cache_path (str): SQLite file caching transcriptions
+            preprocessor (ImagePreprocessor): Image preparation before upload
+            endpoint (str): Gemini REST API root to call instead of the SDK
+                (a proxy or a local stand-in server)
         """
         self.api_key = api_key
+        self.endpoint = endpoint
         self.prompt_file = prompt_file
         self.prompt = None
         self.model = None
+        self.model_name = MODEL_NAME
+        self.preprocessor = preprocessor or ImagePreprocessor()
+        self.band_transcriber = None # Set by set_bands()
+        
+        # Responses cached by (image hash, prompt hash, model)
+        self.cache = TranscriptionCache(cache_path or os.path.join(os.getcwd(), 'cache', 'transcriptions.sqlite'))
+        self._image_hashes = {} # (path, mtime, size) -> SHA-256
         
         if api_key:
             self.configure(api_key)
@@ -38,10 +60,16 @@ class GeminiAPI:
         """
         try:
             self.api_key = api_key
-            genai.configure(api_key=api_key)
-            
-            # Initialize the model (using Gemini 3 Pro Preview which supports vision)
-            self.model = genai.GenerativeModel('gemini-3-pro-preview')
+            if self.endpoint:
+                from src.transport import HttpGenerativeModel
+                self.model = HttpGenerativeModel(self.endpoint, self.model_name, api_key)
+            else:
+                # Imported here: the SDK (and grpc) takes about a second to import
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                
+                # Initialize the model (using Gemini 3 Pro Preview which supports vision)
+                self.model = genai.GenerativeModel(self.model_name)
             
             logger.info("Gemini API configured successfully")
         except Exception as e:
@@ -81,36 +109,218 @@ class GeminiAPI:
             str: TSV transcription response, or None on error
         """
         try:
-            if not self.model:
-                logger.error("API not configured. Please set API key first.")
-                return None
-            
-            if not self.prompt:
-                self.load_prompt()
-            
-            if not self.prompt:
-                logger.error("No prompt available")
-                return None
+            return self.generate_tsv(image_path)
+        except Exception as e:
+            logger.error(f"Error transcribing image: {e}")
+            return None
+    
+    def _cache_key(self, image_path):
+        """Returns the transcription cache key of an image, or None without prompt."""
+        if not self.prompt:
+            self.load_prompt()
+        if not self.prompt:
+            return None
+        
+        stat = os.stat(image_path)
+        file_id = (os.path.abspath(image_path), stat.st_mtime, stat.st_size)
+        image_sha256 = self._image_hashes.get(file_id)
+        if image_sha256 is None:
+            image_sha256 = file_sha256(image_path)
+            self._image_hashes[file_id] = image_sha256
+        variant = self.preprocessor.signature()
+        if self.band_transcriber:
+            variant += f"-{self.band_transcriber.signature()}"
+        return transcription_key(image_sha256, self.prompt, self.model_name, variant)
+    
+    def set_bands(self, bands, overlap=0.06):
+        """
+        Transcribe pages as `bands` overlapping horizontal bands in parallel
+        (1 to send the whole page in one request).
+        """
+        self.band_transcriber = BandTranscriber(self, bands, overlap) if bands > 1 else None
+    
+    @property
+    def requests_per_page(self):
+        """Number of API calls made to transcribe one page."""
+        return self.band_transcriber.bands if self.band_transcriber else 1
+    
+    def cached_transcription(self, image_path):
+        """
+        Returns the cached TSV for this image, prompt and model, or None.
+        Never calls the API.
+        """
+        if not self.cache.exists():
+            # Nothing cached yet: skip hashing the image
+            return None
+        try:
+            key = self._cache_key(image_path)
+            return self.cache.get(key) if key else None
+        except OSError as e:
+            logger.error(f"Error reading image for cache lookup: {e}")
+            return None
+    
+    def restore_cached_tsv(self, image_path):
+        """
+        Write the cached transcription of an image to its TSV file.
+        
+        Returns:
+            str: Path to the TSV file, or None if nothing is cached
+        """
+        tsv_content = self.cached_transcription(image_path)
+        if not tsv_content:
+            return None
+        logger.info("Restoring transcription from cache")
+        return self.save_tsv(tsv_content, image_path)
+    
+    def generate_tsv(self, image_path, timeout=None):
+        """
+        Like transcribe_image, but raises API errors so that callers can
+        retry them (the exception's `code` attribute holds the HTTP status).
+        
+        Args:
+            image_path (str): Path to the image file
+            timeout (float): Request timeout in seconds, None for the SDK default
             
-            # Load the image
+        Returns:
+            str: TSV transcription response, or None if not configured or empty
+        """
+        if not self.model:
+            logger.error("API not configured. Please set API key first.")
+            return None
+        
+        if not self.prompt:
+            self.load_prompt()
+        
+        if not self.prompt:
+            logger.error("No prompt available")
+            return None
+        
+        cache_key = self._cache_key(image_path)
+        cached = self.cache.get(cache_key)
+        if cached:
+            logger.info("Using cached transcription")
+            return cached
+        
+        if self.band_transcriber:
+            tsv_content = self.band_transcriber.transcribe(image_path, timeout)
+        else:
+            # Load, downscale and re-encode the image
             logger.info(f"Loading image: {image_path}")
-            img = Image.open(image_path)
+            data, mime_type = self.preprocessor.prepare(image_path)
+            tsv_content = self.request_tsv(self.prompt, data, mime_type, timeout)
+        
+        if tsv_content:
+            self.cache.put(cache_key, tsv_content)
+        return tsv_content
+    
+    def request_tsv(self, prompt, data, mime_type, timeout=None):
+        """
+        Send one encoded image to the API. Errors are raised.
+        
+        Args:
+            prompt (str): Transcription prompt
+            data (bytes): Encoded image
+            mime_type (str): MIME type of data
+            timeout (float): Request timeout in seconds, None for the SDK default
             
-            # Send to Gemini API
-            logger.info("Sending image to Gemini API...")
-            response = self.model.generate_content([self.prompt, img])
+        Returns:
+            str: Response text, or None if empty
+        """
+        logger.info("Sending image to Gemini API...")
+        request_options = {"timeout": timeout} if timeout else None
+        image_part = {"mime_type": mime_type, "data": data}
+        response = self.model.generate_content([prompt, image_part], request_options=request_options)
+        
+        # Extract the text response
+        if response and response.text:
+            logger.info("Received transcription from Gemini API")
+            return response.text
+        else:
+            logger.error("No response from Gemini API")
+            return None
+    
+    def stream_tsv(self, image_path, on_lines, timeout=None, cancel_event=None):
+        """
+        Like generate_tsv, but streams the response: complete TSV lines are
+        passed to on_lines as they arrive and appended to "<image>.tsv.partial".
+        Band-split pages are delivered at once when all bands are stitched.
+        
+        Args:
+            image_path (str): Path to the image file
+            on_lines (callable): Called with a list of complete lines (header first)
+            timeout (float): Request timeout in seconds, None for the SDK default
+            cancel_event (threading.Event): Stops reading the stream when set
             
-            # Extract the text response
-            if response and response.text:
-                logger.info("Received transcription from Gemini API")
-                return response.text
-            else:
-                logger.error("No response from Gemini API")
-                return None
+        Returns:
+            str: The lines passed to on_lines, joined (without code fences or
+            blank lines), or None if not configured, empty or cancelled
+        """
+        if not self.model:
+            logger.error("API not configured. Please set API key first.")
+            return None
+        
+        if not self.prompt:
+            self.load_prompt()
+        
+        if not self.prompt:
+            logger.error("No prompt available")
+            return None
+        
+        cache_key = self._cache_key(image_path)
+        tsv_content = self.cache.get(cache_key)
+        if tsv_content:
+            logger.info("Using cached transcription")
+        elif self.band_transcriber:
+            tsv_content = self.generate_tsv(image_path, timeout)
+        if tsv_content:
+            lines = _tsv_lines(tsv_content)
+            on_lines(lines)
+            return '\n'.join(lines) + '\n'
+        
+        logger.info(f"Loading image: {image_path}")
+        data, mime_type = self.preprocessor.prepare(image_path)
+        
+        logger.info("Streaming transcription from Gemini API...")
+        request_options = {"timeout": timeout} if timeout else None
+        image_part = {"mime_type": mime_type, "data": data}
+        response = self.model.generate_content([self.prompt, image_part], request_options=request_options, stream=True)
+        
+        chunks = []
+        emitted = [] # Lines passed to on_lines: the saved TSV must hold the same rows
+        pending = ""
+        with open(self.tsv_path(image_path) + ".partial", 'w', encoding='utf-8') as partial:
+            for chunk in response:
+                if cancel_event is not None and cancel_event.is_set():
+                    logger.info("Transcription stream cancelled")
+                    return None
+                chunks.append(chunk.text)
+                pending += chunk.text
                 
-        except Exception as e:
-            logger.error(f"Error transcribing image: {e}")
+                # Keep the unterminated last line for the next chunk
+                complete, _, pending = pending.rpartition('\n')
+                lines = _tsv_lines(complete)
+                if lines:
+                    partial.write('\n'.join(lines) + '\n')
+                    partial.flush()
+                    emitted.extend(lines)
+                    on_lines(lines)
+            
+            lines = _tsv_lines(pending)
+            if lines:
+                partial.write('\n'.join(lines) + '\n')
+                emitted.extend(lines)
+                on_lines(lines)
+        
+        if not emitted:
+            logger.error("No response from Gemini API")
             return None
+        logger.info("Received transcription from Gemini API")
+        self.cache.put(cache_key, ''.join(chunks))
+        return '\n'.join(emitted) + '\n'
+    
+    def tsv_path(self, image_path):
+        """Path of the TSV file saved for an image."""
+        return str(Path(image_path).with_suffix('.tsv'))
     
     def save_tsv(self, tsv_content, image_path):
         """
@@ -125,8 +335,7 @@ class GeminiAPI:
         """
         try:
             # Generate TSV filename from image path
-            image_path_obj = Path(image_path)
-            tsv_path = image_path_obj.with_suffix('.tsv')
+            tsv_path = self.tsv_path(image_path)
             
             logger.info(f"Saving TSV to: {tsv_path}")
             
@@ -135,7 +344,7 @@ class GeminiAPI:
                 f.write(tsv_content)
             
             logger.info("TSV saved successfully")
-            return str(tsv_path)
+            return tsv_path
             
         except Exception as e:
             logger.error(f"Error saving TSV: {e}")
@@ -166,3 +375,35 @@ class GeminiAPI:
         except Exception as e:
             logger.error(f"Error processing image: {e}")
             return None
+    
+    def process_image_streaming(self, image_path, on_lines, cancel_event=None):
+        """
+        Like process_image, but passes TSV lines to on_lines as they are
+        generated (see stream_tsv).
+        
+        Args:
+            image_path (str): Path to the image file
+            on_lines (callable): Called with a list of complete lines (header first)
+            cancel_event (threading.Event): Stops reading the stream when set
+            
+        Returns:
+            str: Path to the saved TSV file, or None on error
+        """
+        try:
+            tsv_content = self.stream_tsv(image_path, on_lines, cancel_event=cancel_event)
+            
+            if not tsv_content:
+                return None
+            
+            tsv_path = self.save_tsv(tsv_content, image_path)
+            
+            # The complete TSV replaces the partial one
+            partial_path = self.tsv_path(image_path) + ".partial"
+            if tsv_path and os.path.exists(partial_path):
+                os.remove(partial_path)
+            
+            return tsv_path
+            
+        except Exception as e:
+            logger.error(f"Error processing image: {e}")
+            return None
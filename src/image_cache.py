@@ -0,0 +1,144 @@
+"""
+Local index of downloaded images, for skip-if-present, conditional
+revalidation and deduplication of identical content.
+"""
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = ".image_cache.sqlite"
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImageCache:
+    """
+    SQLite index stored in the download directory:
+        entries: source URL -> file path, size, SHA-256, ETag, Last-Modified
+        objects: SHA-256 -> canonical file holding that content
+    Files with identical content are hard-linked to one canonical file
+    (copied when the filesystem does not support hard links).
+    """
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory (str): Download directory holding the images and the index
+        """
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.index_path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    url TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS objects (
+                    sha256 TEXT PRIMARY KEY,
+                    path TEXT NOT NULL
+                );
+            """)
+        return self._conn
+
+    def lookup(self, url):
+        """
+        Returns the cache entry of url as a dict if its file is still on disk
+        with the recorded size, else None.
+        """
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT path, size, sha256, etag, last_modified FROM entries WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        path, size, sha256, etag, last_modified = row
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            return None
+        return {"path": path, "size": size, "sha256": sha256, "etag": etag, "last_modified": last_modified}
+
+    def materialize(self, entry, filepath):
+        """
+        Make the cached content of entry available at filepath.
+
+        Returns:
+            str: filepath
+        """
+        if os.path.abspath(entry["path"]) != os.path.abspath(filepath):
+            self._link(entry["path"], filepath)
+        return filepath
+
+    def touch(self, url):
+        """Record a successful revalidation (304 Not Modified)."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("UPDATE entries SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            conn.commit()
+
+    def store(self, url, filepath, etag=None, last_modified=None):
+        """
+        Index a freshly downloaded file, deduplicating its content.
+
+        Returns:
+            str: filepath
+        """
+        size = os.path.getsize(filepath)
+        sha256 = file_sha256(filepath)
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT path FROM objects WHERE sha256 = ?", (sha256,)).fetchone()
+            canonical = row[0] if row else None
+            if canonical and os.path.abspath(canonical) != os.path.abspath(filepath) \
+                    and os.path.exists(canonical) and os.path.getsize(canonical) == size:
+                # Same content already stored: keep a single copy on disk
+                self._link(canonical, filepath)
+                logger.info(f"Deduplicated {os.path.basename(filepath)} with {os.path.basename(canonical)}")
+            else:
+                conn.execute("INSERT OR REPLACE INTO objects (sha256, path) VALUES (?, ?)", (sha256, filepath))
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (url, path, size, sha256, etag, last_modified, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, filepath, size, sha256, etag, last_modified, time.time())
+            )
+            conn.commit()
+        return filepath
+
+    def _link(self, source, target):
+        """Replace target with a hard link to source (copy as fallback)."""
+        tmp_path = f"{target}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
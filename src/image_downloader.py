@@ -2,37 +2,104 @@
 Module to download images from URLs.
 """
 import os
+import io
+import re
+import math
+import time
+import threading
 import requests
 import logging
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit, parse_qs, quote
+from requests.adapters import HTTPAdapter
+
+from src.rate_limit import HostRateLimiter, backoff_delay, is_retryable_status
+from src.image_cache import ImageCache
+from src.transport import mount_transport
 
 logger = logging.getLogger(__name__)
 
+CHUNK_SIZE = 256 * 1024
+
+
+def _resume_validator(headers):
+    """
+    Validator to send as If-Range when resuming a download: a strong ETag,
+    else Last-Modified (If-Range does not accept weak ETags). None if the
+    response has neither.
+    """
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+
+def _remove_part(part_path):
+    """Delete a partial download and the validator kept next to it."""
+    for path in (part_path, part_path + '.validator'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class DownloadCancelled(Exception):
+    """Raised when a download is cancelled through its cancel_event."""
+
 
 class ImageDownloader:
     """Downloads images from URLs and saves them with appropriate names."""
     
-    def __init__(self, download_dir=None):
+    def __init__(self, download_dir=None, max_retries=3, requests_per_second=2.0, burst=4, pool_size=8,
+                 revalidate=False, tiled=False, tile_workers=8, tile_requests_per_second=20.0, transport=None):
         """
         Initialize the image downloader.
         
         Args:
             download_dir (str): Directory to save downloaded images
+            max_retries (int): Resume attempts after a network failure
+            requests_per_second (float): Per-host request rate limit (<= 0 to disable)
+            burst (int): Requests allowed at once before the rate limit applies
+            pool_size (int): HTTP connections kept per host
+            revalidate (bool): Check cached images with a conditional GET instead
+                of serving them from disk without any request
+            tiled (bool): Download iipsrv images as parallel tiles stitched locally
+                instead of one full-size CVT=JPG conversion
+            tile_workers (int): Concurrent tile requests in tiled mode
+            tile_requests_per_second (float): Additional per-host rate limit for tile
+                requests, which also count against requests_per_second
+            transport (requests.adapters.HTTPAdapter): Adapter for all requests
+                (e.g. LocalRedirectAdapter), None for direct connections
         """
         self.download_dir = download_dir or os.path.join(os.getcwd(), 'downloaded_images')
+        self.max_retries = max_retries
+        self.revalidate = revalidate
+        self._cache = None
+        self._cache_lock = threading.Lock()
+        self.rate_limiter = HostRateLimiter(requests_per_second, burst)
+        self.tiled = tiled
+        self.tile_workers = tile_workers
+        self.tile_rate_limiter = HostRateLimiter(tile_requests_per_second, tile_workers)
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
+        adapter = transport or HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        mount_transport(self.session, adapter)
     
-    def download_image(self, image_url, cote, page):
+    def download_image(self, image_url, cote, page, cancel_event=None):
         """
         Download an image and save it with a clear filename.
         
+        The image is streamed to "<file>.part" and renamed when complete;
+        an interrupted download resumes from the partial file with an
+        HTTP Range request. Images already downloaded from the same URL are
+        served from the local cache index.
+        
         Args:
             image_url (str): URL of the image to download
             cote (str): Cote identifier
             page (str): Page number
+            cancel_event (threading.Event): Optional, stops the download when set
             
         Returns:
             str: Path to the downloaded image, or None on error
@@ -45,8 +112,6 @@ class ImageDownloader:
             filename = f"{cote}_{page}.jpg"
             filepath = os.path.join(self.download_dir, filename)
             
-            logger.info(f"Downloading image to: {filepath}")
-            
             # For IIIF servers, we need to request the full resolution image
             # Remove thumbnail parameters and request full size
             if 'iipsrv.fcgi' in image_url:
@@ -56,22 +121,77 @@ class ImageDownloader:
                     if '&CVT=JPG' not in image_url:
                         image_url += '&CVT=JPG'
                     # Remove size limitations
-                    import re
                     image_url = re.sub(r'&HEI=\d+', '', image_url)
                     image_url = re.sub(r'&WID=\d+', '', image_url)
                     image_url = re.sub(r'&SIZE=\d+', '', image_url)
             
-            # Download the image
-            response = self.session.get(image_url, timeout=60)
-            response.raise_for_status()
+            # Skip the download when this URL is already on disk
+            cache = self._image_cache()
+            entry = cache.lookup(image_url)
+            conditional_headers = None
+            if entry is not None:
+                if not self.revalidate:
+                    logger.info(f"Image already downloaded: {filename}")
+                    return cache.materialize(entry, filepath)
+                conditional_headers = {}
+                if entry.get('etag'):
+                    conditional_headers['If-None-Match'] = entry['etag']
+                if entry.get('last_modified'):
+                    conditional_headers['If-Modified-Since'] = entry['last_modified']
+            
+            logger.info(f"Downloading image to: {filepath}")
+            
+            part_path = filepath + '.part'
+            
+            # Very large scans: fetch tiles in parallel and stitch them locally
+            if self.tiled and 'iipsrv.fcgi' in image_url:
+                try:
+                    validators = self._download_tiled(image_url, part_path, cancel_event, conditional_headers)
+                    if validators is None:
+                        logger.info(f"Cached image still valid: {filename}")
+                        cache.touch(image_url)
+                        return cache.materialize(entry, filepath)
+                    os.replace(part_path, filepath)
+                    _remove_part(part_path)
+                    cache.store(image_url, filepath, validators.get('etag'), validators.get('last_modified'))
+                    logger.info(f"Successfully downloaded image (tiled): {filename}")
+                    return filepath
+                except DownloadCancelled:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Tiled download failed ({e}), falling back to full image request")
+                    _remove_part(part_path)
             
-            # Save to file
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+            # Download the image, resuming after network failures
+            for attempt in range(self.max_retries + 1):
+                try:
+                    validators = self._download_to_part(image_url, part_path, cancel_event, conditional_headers)
+                    break
+                except requests.HTTPError as e:
+                    status = e.response.status_code if e.response is not None else 0
+                    if attempt == self.max_retries or not is_retryable_status(status):
+                        raise
+                    self._wait_before_retry(attempt, e, cancel_event)
+                except requests.RequestException as e:
+                    if attempt == self.max_retries:
+                        raise
+                    self._wait_before_retry(attempt, e, cancel_event)
+            
+            if validators is None:
+                logger.info(f"Cached image still valid: {filename}")
+                cache.touch(image_url)
+                return cache.materialize(entry, filepath)
+            
+            os.replace(part_path, filepath)
+            _remove_part(part_path)
+            cache.store(image_url, filepath, validators.get('etag'), validators.get('last_modified'))
             
             logger.info(f"Successfully downloaded image: {filename}")
             return filepath
             
+        except DownloadCancelled:
+            logger.info(f"Download cancelled, partial file kept for resume: {filename}")
+            return None
         except requests.RequestException as e:
             logger.error(f"Network error downloading image: {e}")
             return None
@@ -82,6 +202,255 @@ class ImageDownloader:
             logger.error(f"Unexpected error downloading image: {e}")
             return None
     
+    def _wait_before_retry(self, attempt, error, cancel_event=None):
+        """Sleep with exponential backoff and jitter (or Retry-After on 429)."""
+        delay = backoff_delay(attempt)
+        response = getattr(error, 'response', None)
+        if response is not None and response.headers.get('Retry-After', '').isdigit():
+            delay = max(delay, int(response.headers['Retry-After']))
+        logger.warning(f"Download interrupted ({error}), retrying in {delay:.1f}s "
+                       f"(attempt {attempt + 1}/{self.max_retries})")
+        if cancel_event is not None:
+            if cancel_event.wait(delay):
+                raise DownloadCancelled()
+        else:
+            time.sleep(delay)
+    
+    def _get_with_retries(self, url, cancel_event=None, rate_limiter=None, headers=None):
+        """
+        GET a small resource fully into memory, retrying with backoff.
+        Every request counts against the per-host rate limit; rate_limiter
+        is an additional limit (e.g. for tiles).
+        
+        Returns:
+            requests.Response (304 Not Modified is returned, not raised)
+        """
+        rate_limiters = [self.rate_limiter] + ([rate_limiter] if rate_limiter else [])
+        for attempt in range(self.max_retries + 1):
+            if not all(limiter.acquire(url, cancel_event) for limiter in rate_limiters):
+                raise DownloadCancelled()
+            try:
+                response = self.session.get(url, headers=headers, timeout=(10, 60))
+                response.raise_for_status()
+                return response
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else 0
+                if attempt == self.max_retries or not is_retryable_status(status):
+                    raise
+                self._wait_before_retry(attempt, e, cancel_event)
+            except requests.RequestException as e:
+                if attempt == self.max_retries:
+                    raise
+                self._wait_before_retry(attempt, e, cancel_event)
+    
+    def _download_tiled(self, image_url, part_path, cancel_event=None, conditional_headers=None):
+        """
+        Download an iipsrv image through the IIP tile protocol (JTL) and
+        stitch the full-resolution tiles into a JPEG at part_path.
+        The metadata request carries conditional_headers: iipsrv answers
+        304 when the image file is unchanged, and no tile is fetched.
+        
+        Returns:
+            dict: {'etag', 'last_modified'} of the metadata response, or None
+            if the server answered 304 Not Modified to conditional_headers
+        """
+        from PIL import Image
+        
+        parts = urlsplit(image_url)
+        fif = parse_qs(parts.query).get('FIF', [None])[0]
+        if not fif:
+            raise ValueError("No FIF parameter in image URL")
+        base_url = f"{parts.scheme}://{parts.netloc}{parts.path}?FIF={quote(fif, safe='/')}"
+        
+        # Image metadata: "Max-size:W H", "Tile-size:w h", "Resolution-number:n"
+        info_response = self._get_with_retries(
+            f"{base_url}&OBJ=IIP,1.0&OBJ=Max-size&OBJ=Tile-size&OBJ=Resolution-number", cancel_event,
+            headers=conditional_headers
+        )
+        if info_response.status_code == 304 and conditional_headers is not None:
+            return None
+        info = info_response.text
+        def info_numbers(key):
+            match = re.search(rf'{key}:\s*([\d ]+)', info)
+            if not match:
+                raise ValueError(f"Missing {key} in IIP response")
+            return [int(v) for v in match.group(1).split()]
+        width, height = info_numbers('Max-size')[:2]
+        tile_w, tile_h = info_numbers('Tile-size')[:2]
+        resolution = info_numbers('Resolution-number')[0] - 1 # Highest resolution
+        
+        cols = math.ceil(width / tile_w)
+        rows = math.ceil(height / tile_h)
+        logger.info(f"Tiled download: {width}x{height}, {cols}x{rows} tiles of {tile_w}x{tile_h}")
+        
+        def fetch_tile(index):
+            if cancel_event is not None and cancel_event.is_set():
+                raise DownloadCancelled()
+            response = self._get_with_retries(f"{base_url}&JTL={resolution},{index}", cancel_event,
+                                              self.tile_rate_limiter)
+            return index, response.content
+        
+        canvas = Image.new('RGB', (width, height))
+        with ThreadPoolExecutor(max_workers=max(1, self.tile_workers)) as executor:
+            futures = [executor.submit(fetch_tile, i) for i in range(cols * rows)]
+            try:
+                for future in as_completed(futures):
+                    index, content = future.result()
+                    with Image.open(io.BytesIO(content)) as tile:
+                        canvas.paste(tile.convert('RGB'), ((index % cols) * tile_w, (index // cols) * tile_h))
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        
+        canvas.save(part_path, 'JPEG', quality=95)
+        return {
+            'etag': info_response.headers.get('ETag'),
+            'last_modified': info_response.headers.get('Last-Modified'),
+        }
+    
+    def _image_cache(self):
+        with self._cache_lock:
+            if self._cache is None or self._cache.directory != self.download_dir:
+                if self._cache is not None:
+                    self._cache.close()
+                self._cache = ImageCache(self.download_dir)
+            return self._cache
+    
+    def _download_to_part(self, image_url, part_path, cancel_event=None, conditional_headers=None):
+        """
+        Stream image_url into part_path, continuing an existing partial file.
+        The validator of the response that started the file is kept in
+        "<part_path>.validator" and sent as If-Range on resume, so that a
+        changed image is downloaded again from the start instead of being
+        appended to stale bytes.
+        Raises requests.RequestException or IOError on failure.
+        
+        Returns:
+            dict: {'etag', 'last_modified'} of the response, or None if the
+            server answered 304 Not Modified to conditional_headers
+        """
+        if not self.rate_limiter.acquire(image_url, cancel_event):
+            raise DownloadCancelled()
+        
+        validator_path = part_path + '.validator'
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        validator = None
+        if offset and os.path.exists(validator_path):
+            with open(validator_path, 'r', encoding='utf-8') as f:
+                validator = f.read().strip()
+        if offset and not validator:
+            # Without a validator the partial file cannot be checked: restart
+            logger.warning("Partial download has no validator, restarting download")
+            _remove_part(part_path)
+            offset = 0
+        
+        if offset:
+            headers = {'Range': f'bytes={offset}-', 'If-Range': validator}
+        else:
+            headers = dict(conditional_headers or {})
+        
+        with self.session.get(image_url, headers=headers, stream=True, timeout=(10, 60)) as response:
+            if response.status_code == 304 and conditional_headers is not None:
+                return None
+            if response.status_code == 416:
+                # Range not satisfiable: the partial file is unusable, restart
+                logger.warning("Server rejected resume range, restarting download")
+                _remove_part(part_path)
+                raise requests.RequestException("Invalid resume range")
+            response.raise_for_status()
+            
+            expected_size = None
+            if response.status_code == 206:
+                # Content-Range: bytes <start>-<end>/<total>
+                match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', response.headers.get('Content-Range', ''))
+                if not match or int(match.group(1)) != offset:
+                    _remove_part(part_path)
+                    raise requests.RequestException("Unexpected Content-Range on resume")
+                if match.group(2) != '*':
+                    expected_size = int(match.group(2))
+                mode = 'ab'
+                logger.info(f"Resuming download at {offset} bytes")
+            else:
+                # Full response: fresh download, no range support, or the
+                # image changed since the partial file was started (If-Range)
+                if offset:
+                    logger.info("Image changed or range not supported, restarting download")
+                offset = 0
+                mode = 'wb'
+                new_validator = _resume_validator(response.headers)
+                if new_validator:
+                    with open(validator_path, 'w', encoding='utf-8') as f:
+                        f.write(new_validator)
+                elif os.path.exists(validator_path):
+                    os.remove(validator_path)
+            
+            if expected_size is None and response.headers.get('Content-Length') and \
+                    'Content-Encoding' not in response.headers:
+                expected_size = offset + int(response.headers['Content-Length'])
+            
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise DownloadCancelled()
+                    if chunk:
+                        f.write(chunk)
+        
+        size = os.path.getsize(part_path)
+        if expected_size is not None and size != expected_size:
+            # Keep the partial file: the next attempt resumes from it
+            raise requests.RequestException(f"Incomplete download: {size} of {expected_size} bytes")
+        if size == 0:
+            _remove_part(part_path)
+            raise IOError("Empty image response")
+        
+        return {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+    
+    def download_images(self, items, workers=4, progress_callback=None, cancel_event=None):
+        """
+        Download many images concurrently over the shared session.
+        
+        Requests to each host are throttled by the per-host rate limit, and
+        each download retries with exponential backoff.
+        
+        Args:
+            items (list): (image_url, cote, page) tuples
+            workers (int): Number of concurrent downloads
+            progress_callback (callable): Called as progress_callback(done, total, item, path)
+                on the calling thread after each image (path is None on failure)
+            cancel_event (threading.Event): Optional, stops pending downloads when set
+            
+        Returns:
+            list: Downloaded file paths (None on failure), in the order of items
+        """
+        results = [None] * len(items)
+        if not items:
+            return results
+        
+        done = 0
+        
+        def download(index):
+            item = items[index]
+            if cancel_event is not None and cancel_event.is_set():
+                return index, None
+            return index, self.download_image(*item, cancel_event=cancel_event)
+        
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [executor.submit(download, i) for i in range(len(items))]
+            for future in as_completed(futures):
+                index, path = future.result()
+                results[index] = path
+                done += 1
+                if progress_callback is not None:
+                    progress_callback(done, len(items), items[index], path)
+        
+        failed = sum(1 for path in results if path is None)
+        logger.info(f"Downloaded {len(items) - failed}/{len(items)} images")
+        return results
+    
     def set_download_directory(self, directory):
         """
         Set the download directory.
@@ -0,0 +1,114 @@
+"""
+Image preparation before upload to the Gemini API: reduced decoding,
+long edge cap, optional grayscale and contrast normalization, re-encoding.
+"""
+import io
+import math
+import logging
+
+# PIL is imported by load(): opening a local image only needs signature()
+# (transcription cache lookup), which should not pay for it at startup
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+}
+
+
+class ImagePreprocessor:
+    """
+    Turns a scan into the bytes sent to the API.
+
+    Large JPEG scans are decoded at a reduced scale with draft() (the
+    decoder skips the discarded resolution, so an 8000 px page never
+    exists in memory at full size), then shrunk with reduce() and a
+    final resampling to the long edge cap. Bounding boxes are requested
+    in 0-1000 page coordinates, so resizing does not affect them.
+    """
+
+    def __init__(self, max_edge=3072, grayscale=False, autocontrast=False, format="JPEG", quality=90):
+        """
+        Args:
+            max_edge (int): Maximum length of the long edge in pixels, 0 to keep the size
+            grayscale (bool): Convert to 8-bit grayscale
+            autocontrast (bool): Stretch the histogram (1% cutoff at both ends)
+            format (str): Encoding sent to the API: "JPEG", "WEBP" or "PNG"
+            quality (int): JPEG/WebP quality (1-100)
+        """
+        format = format.upper()
+        if format not in MIME_TYPES:
+            raise ValueError(f"Unsupported upload format: {format}")
+        self.max_edge = max_edge
+        self.grayscale = grayscale
+        self.autocontrast = autocontrast
+        self.format = format
+        self.quality = quality
+
+    def signature(self):
+        """Short string identifying the options, part of the transcription cache key."""
+        mode = "L" if self.grayscale else "RGB"
+        contrast = "ac" if self.autocontrast else "raw"
+        quality = "" if self.format == "PNG" else str(self.quality)
+        return f"{self.max_edge}-{mode}-{contrast}-{self.format}{quality}"
+
+    def load(self, image_path):
+        """
+        Decode and transform an image.
+
+        Returns:
+            PIL.Image.Image: Image ready to encode
+        """
+        from PIL import Image, ImageOps
+        mode = "L" if self.grayscale else "RGB"
+        with Image.open(image_path) as img:
+            if self.max_edge and max(img.size) > self.max_edge:
+                scale = self.max_edge / max(img.size)
+                # JPEG only: decode at the smallest 1/2^n scale still >= the target
+                img.draft(mode, (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+            img.load()
+            # Detach from the file so it can be closed
+            img = img.convert(mode) if img.mode != mode else img.copy()
+
+        if self.max_edge and max(img.size) > self.max_edge:
+            # Cheap integer box reduction first, precise resampling on the small image
+            factor = max(img.size) // self.max_edge
+            if factor >= 2:
+                img = img.reduce(factor)
+            if max(img.size) > self.max_edge:
+                scale = self.max_edge / max(img.size)
+                size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+                img = img.resize(size, Image.Resampling.LANCZOS)
+
+        if self.autocontrast:
+            img = ImageOps.autocontrast(img, cutoff=1)
+        return img
+
+    def prepare(self, image_path):
+        """
+        Encode an image for upload.
+
+        Returns:
+            tuple: (encoded bytes, MIME type)
+        """
+        return self.encode(self.load(image_path))
+
+    def encode(self, img):
+        """
+        Encode an image loaded with load() (or a crop of it).
+
+        Returns:
+            tuple: (encoded bytes, MIME type)
+        """
+        buffer = io.BytesIO()
+        if self.format == "PNG":
+            img.save(buffer, format="PNG", optimize=False)
+        elif self.format == "WEBP":
+            img.save(buffer, format="WEBP", quality=self.quality, method=4)
+        else:
+            img.save(buffer, format="JPEG", quality=self.quality, optimize=True)
+        data = buffer.getvalue()
+        logger.info(f"Prepared upload: {img.width}x{img.height} {img.mode} {self.format}, {len(data) / 1024:.0f} KiB")
+        return data, MIME_TYPES[self.format]
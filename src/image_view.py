@@ -1,7 +1,19 @@
+import os
+import logging
 from PySide6.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsRectItem, QGraphicsItem
 from PySide6.QtCore import Qt, QRectF, Signal, QPointF
-from PySide6.QtGui import QPen, QBrush, QColor, QPainter, QCursor
+from PySide6.QtGui import QPen, QBrush, QColor, QPainter, QCursor, QPixmap
 from src.config_manager import ConfigManager
+from src.job_runner import Job, JobCancelled
+from src.tile_pyramid import TilePyramid, TileCache, TileLoader, image_size, load_preview
+
+logger = logging.getLogger(__name__)
+
+# Images above this size are displayed through a tile pyramid
+TILED_MIN_PIXELS = 4096 * 4096
+# Long edge of the preview shown while the pyramid of a new image is built
+PREVIEW_MAX_EDGE = 2048
+TILE_CACHE_DIR = os.path.join(os.getcwd(), 'cache', 'tiles')
 
 class BBoxItem(QGraphicsRectItem):
     def __init__(self, rect, row_index, view):
@@ -72,6 +84,63 @@ class BBoxItem(QGraphicsRectItem):
             # We can check if pos changed, or just always notify on release
             self.view.notify_bbox_changed(self)
 
+class TiledImageItem(QGraphicsItem):
+    """
+    Draws a TilePyramid: only the tiles intersecting the exposed area, at
+    the level matching the zoom. A tile not loaded yet is requested from
+    the view's TileLoader and drawn meanwhile from a coarser cached tile,
+    or from the single-tile top level of the pyramid.
+    """
+
+    def __init__(self, pyramid, view):
+        super().__init__()
+        self.pyramid = pyramid
+        self.view = view
+        top = pyramid.levels - 1
+        self.overview = QPixmap.fromImage(pyramid.load_tile(top, 0, 0))
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.pyramid.width, self.pyramid.height)
+
+    def paint(self, painter, option, widget=None):
+        pyramid = self.pyramid
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = pyramid.level_for_scale(scale)
+        exposed = option.exposedRect.intersected(self.boundingRect())
+
+        painter.save()
+        # Antialiased edges would show seams between tiles
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing, False)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, True)
+        for col, row in pyramid.tiles_in_rect(level, exposed.left(), exposed.top(), exposed.right(), exposed.bottom()):
+            target = QRectF(*pyramid.tile_rect(level, col, row))
+            pixmap = self.view.tile_cache.get((pyramid.key, level, col, row))
+            if pixmap is not None:
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+            else:
+                self.view.tile_loader.request(pyramid, level, col, row)
+                self._paint_fallback(painter, level, col, row, target)
+        painter.restore()
+
+    def _paint_fallback(self, painter, level, col, row, target):
+        for coarser in range(level + 1, self.pyramid.levels):
+            shift = coarser - level
+            pixmap = self.view.tile_cache.get((self.pyramid.key, coarser, col >> shift, row >> shift))
+            if pixmap is not None:
+                parent = QRectF(*self.pyramid.tile_rect(coarser, col >> shift, row >> shift))
+                break
+        else:
+            pixmap = self.overview
+            parent = self.boundingRect()
+
+        sx = pixmap.width() / parent.width()
+        sy = pixmap.height() / parent.height()
+        source = QRectF((target.left() - parent.left()) * sx, (target.top() - parent.top()) * sy,
+                        target.width() * sx, target.height() * sy)
+        painter.drawPixmap(target, pixmap, source)
+
+
 class ImageView(QGraphicsView):
     bboxSelected = Signal(int) # Emits row_index
     bboxModified = Signal(int, list) # Emits row_index, [ymin, xmin, ymax, xmax] (0-1000)
@@ -90,25 +159,102 @@ class ImageView(QGraphicsView):
         self.image_width = 0
         self.image_height = 0
         
+        # Large scans: tile pyramid, bounded cache of the tiles on screen
+        self.tiled_item = None
+        self.pyramid_job = None
+        self.tile_cache = TileCache(ConfigManager().get_ui_param('tile_cache_mb') * 1024 * 1024)
+        self.tile_loader = TileLoader()
+        self.tile_loader.tile_loaded.connect(self.on_tile_loaded)
+        
         self.current_bboxes = {} # row_index -> BBoxItem
+        self.data_model = None
         
         # Creation Mode
         self.creation_mode = False
         self.temp_rect_item = None
         self.start_creation_pos = None
 
-    def set_image(self, pixmap):
+    def _clear_image(self):
+        if self.pyramid_job is not None:
+            self.pyramid_job.cancel()
+            self.pyramid_job = None
+        self.tile_loader.clear()
         self.scene.clear()
         self.current_bboxes.clear()
+        self.pixmap_item = None
+        self.tiled_item = None
+
+    def has_image(self):
+        return self.image_width > 0 and self.image_height > 0
+
+    def set_image(self, pixmap):
+        self._clear_image()
         self.pixmap_item = self.scene.addPixmap(pixmap)
         self.image_width = pixmap.width()
         self.image_height = pixmap.height()
         self.setSceneRect(0, 0, self.image_width, self.image_height)
 
-    def add_bbox(self, row_index, bbox_norm):
-        if self.image_width == 0 or self.image_height == 0:
+    def set_image_file(self, image_path):
+        """
+        Show an image file. Small images are shown as one pixmap. Large scans
+        are drawn from a tile pyramid; the first time a scan is opened, a
+        downscaled preview is shown while its pyramid is built in the background.
+        Scene coordinates are full resolution pixels in both cases.
+        """
+        width, height = image_size(image_path)
+        if width * height <= TILED_MIN_PIXELS:
+            self.set_image(QPixmap(image_path))
             return
 
+        self._clear_image()
+        self.image_width = width
+        self.image_height = height
+        self.setSceneRect(0, 0, width, height)
+
+        pyramid = TilePyramid(image_path, TILE_CACHE_DIR)
+        if pyramid.is_built():
+            pyramid.touch()
+            self._show_pyramid(pyramid)
+            return
+
+        preview = load_preview(image_path, PREVIEW_MAX_EDGE)
+        self.pixmap_item = self.scene.addPixmap(QPixmap.fromImage(preview))
+        self.pixmap_item.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
+        self.pixmap_item.setScale(width / max(1, preview.width()))
+        self.pixmap_item.setZValue(-1)
+
+        self.pyramid_job = Job(self._build_pyramid, pyramid)
+        self.pyramid_job.succeeded.connect(self._show_pyramid)
+        self.pyramid_job.failed.connect(lambda message: logger.error(f"Tile pyramid not built, keeping the preview: {message}"))
+        self.pyramid_job.start()
+
+    @staticmethod
+    def _build_pyramid(job, pyramid):
+        if not pyramid.build(job.cancel_event):
+            raise JobCancelled()
+        return pyramid
+
+    def _show_pyramid(self, pyramid):
+        self.pyramid_job = None
+        if self.pixmap_item is not None:
+            # Replace the preview
+            self.scene.removeItem(self.pixmap_item)
+            self.pixmap_item = None
+        self.tiled_item = TiledImageItem(pyramid, self)
+        # Below the bboxes, which may already be drawn
+        self.tiled_item.setZValue(-1)
+        self.scene.addItem(self.tiled_item)
+
+    def on_tile_loaded(self, key, image):
+        if self.tiled_item is None or key[0] != self.tiled_item.pyramid.key:
+            return
+        self.tile_cache.put(key, QPixmap.fromImage(image))
+        self.tiled_item.update(QRectF(*self.tiled_item.pyramid.tile_rect(*key[1:])))
+
+    def set_tile_cache_size(self, megabytes):
+        self.tile_cache.set_max_bytes(megabytes * 1024 * 1024)
+
+    def _bbox_rect(self, bbox_norm):
         ymin, xmin, ymax, xmax = bbox_norm
         
         x = (xmin / 1000.0) * self.image_width
@@ -116,11 +262,94 @@ class ImageView(QGraphicsView):
         w = ((xmax - xmin) / 1000.0) * self.image_width
         h = ((ymax - ymin) / 1000.0) * self.image_height
         
-        rect = QRectF(x, y, w, h)
+        return QRectF(x, y, w, h)
+
+    def add_bbox(self, row_index, bbox_norm):
+        if self.image_width == 0 or self.image_height == 0:
+            return
+
+        # Never keep two items for the same row
+        self.remove_bbox(row_index)
+        rect = self._bbox_rect(bbox_norm)
         item = BBoxItem(rect, row_index, self)
         self.scene.addItem(item)
         self.current_bboxes[row_index] = item
 
+    def update_bbox(self, row_index, bbox_norm):
+        """
+        Moves/resizes the item of row_index, creating or removing it as needed.
+        bbox_norm: [ymin, xmin, ymax, xmax] (0-1000) or None
+        """
+        item = self.current_bboxes.get(row_index)
+        if bbox_norm is None:
+            self.remove_bbox(row_index)
+        elif item is None:
+            self.add_bbox(row_index, bbox_norm)
+        else:
+            rect = self._bbox_rect(bbox_norm)
+            # Dragging moves pos(); fold it back into the rect
+            if item.pos() != QPointF(0, 0) or item.rect() != rect:
+                item.setPos(0, 0)
+                item.setRect(rect)
+
+    def remove_bbox(self, row_index):
+        item = self.current_bboxes.pop(row_index, None)
+        if item is not None:
+            self.scene.removeItem(item)
+
+    def sync_bboxes(self, bboxes, valid):
+        """
+        Reconciles current_bboxes with DataModel's bbox array: adds, moves or
+        removes only the items that differ.
+        bboxes: (rows x 4) array [ymin, xmin, ymax, xmax] (0-1000)
+        valid: (rows,) bool array
+        """
+        if self.image_width == 0 or self.image_height == 0:
+            return
+
+        row_count = len(valid)
+        for row in [r for r in self.current_bboxes if r >= row_count or not valid[r]]:
+            self.remove_bbox(row)
+
+        for row in range(row_count):
+            if valid[row]:
+                self.update_bbox(row, bboxes[row].tolist())
+
+    def _shift_bboxes(self, first, delta):
+        """Renumbers items with row_index >= first by delta."""
+        moved = sorted((r for r in self.current_bboxes if r >= first), reverse=delta > 0)
+        for row in moved:
+            item = self.current_bboxes.pop(row)
+            item.row_index = row + delta
+            self.current_bboxes[row + delta] = item
+
+    def set_data_model(self, data_model):
+        """Follow DataModel change notifications to update only affected items."""
+        self.data_model = data_model
+        data_model.add_listener(self)
+
+    # DataModel notifications
+
+    def cells_changed(self, top, left, bottom, right):
+        if not left <= self.data_model.bbox_col_index <= right:
+            return
+        for row in range(top, bottom + 1):
+            self.update_bbox(row, self.data_model.get_bbox(row))
+
+    def rows_inserted(self, first, last):
+        self._shift_bboxes(first, last - first + 1)
+        for row in range(first, last + 1):
+            self.update_bbox(row, self.data_model.get_bbox(row))
+
+    def model_reset(self):
+        if self.data_model.bbox_array is not None:
+            self.sync_bboxes(*self.data_model.get_bboxes())
+
+    def rows_removed(self, first, last):
+        for row in range(first, last + 1):
+            self.remove_bbox(row)
+        self._shift_bboxes(last + 1, -(last - first + 1))
+
     def notify_bbox_changed(self, item):
         # Get absolute rect in scene
         # item.rect() is local. item.pos() is offset.
@@ -168,7 +397,7 @@ class ImageView(QGraphicsView):
     def zoom_reset(self):
         """Reset zoom to fit the entire image."""
         self.resetTransform()
-        if self.pixmap_item:
+        if self.has_image():
             self.fitInView(self.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
     
     def pan(self, dx, dy):
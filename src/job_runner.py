@@ -0,0 +1,105 @@
+"""
+Background job runner delivering progress and results to the Qt main thread.
+"""
+import threading
+import logging
+from PySide6.QtCore import QObject, Signal
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function to stop at a cancellation point."""
+
+
+class Job(QObject):
+    """
+    Runs fn(job, *args) on a worker thread.
+
+    Signals are emitted from the worker thread and, since the Job lives in
+    the main thread, are delivered to main-thread slots through queued
+    connections. cancel() takes effect immediately for the UI: no further
+    progress or result is emitted, even if the current blocking stage
+    (network request, API call) only returns later.
+    """
+
+    progress = Signal(int, str)  # step, label
+    partial = Signal(object)     # intermediate result (see emit_partial)
+    succeeded = Signal(object)   # return value of fn
+    failed = Signal(str)         # error message
+    cancelled = Signal()
+
+    def __init__(self, fn, *args):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self._cancel_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        # Daemon thread so that a stage blocked in the network never delays exit
+        self._thread = threading.Thread(target=self._run, name="Job", daemon=True)
+        self._thread.start()
+
+    def is_running(self):
+        """
+        True until the worker thread returns, including after cancel():
+        a cancelled stage may still be downloading or calling the API.
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def join(self, timeout=None):
+        """
+        Wait for the worker thread to return.
+
+        Returns:
+            bool: True if the thread is finished
+        """
+        if self._thread is None:
+            return True
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def cancel(self):
+        """Cancel the job. Call from the main thread."""
+        if not self._cancel_event.is_set():
+            self._cancel_event.set()
+            self.cancelled.emit()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def cancel_event(self):
+        """threading.Event set on cancel, for stages that can poll it."""
+        return self._cancel_event
+
+    def check_cancelled(self):
+        """Cancellation point for job functions."""
+        if self.is_cancelled():
+            raise JobCancelled()
+
+    def report(self, step, label):
+        """Report progress from the job function."""
+        if not self.is_cancelled():
+            self.progress.emit(step, label)
+
+    def emit_partial(self, value):
+        """Deliver an intermediate result (e.g. streamed rows) from the job function."""
+        if not self.is_cancelled():
+            self.partial.emit(value)
+
+    def _run(self):
+        try:
+            result = self.fn(self, *self.args)
+        except JobCancelled:
+            logger.info("Job cancelled")
+            return
+        except Exception as e:
+            logger.error(f"Job failed: {e}")
+            if not self.is_cancelled():
+                self.failed.emit(str(e))
+            return
+
+        if not self.is_cancelled():
+            self.succeeded.emit(result)
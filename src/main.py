@@ -1,12 +1,15 @@
 import sys
 import os
+import time
+import csv
+import json
 import threading
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                                QHBoxLayout, QPushButton, QFileDialog, QTableView, QSplitter,
                                QScrollArea, QLabel, QSlider, QLineEdit, QMenu, QMessageBox,
                                QDialog, QProgressDialog, QInputDialog)
-from PySide6.QtGui import QPixmap, QKeySequence, QShortcut, QDoubleValidator
-from PySide6.QtCore import QAbstractTableModel, Qt, Signal, QObject
+from PySide6.QtGui import QKeySequence, QShortcut, QDoubleValidator
+from PySide6.QtCore import QAbstractTableModel, Qt, Signal, QObject, QTimer
 
 from src.logger import setup_logging
 from src.data_model import DataModel
@@ -14,13 +17,26 @@ from src.image_view import ImageView
 from src.config_manager import ConfigManager
 from src.settings_dialog import SettingsDialog
 from src.version_checker import check_for_updates
-from src.web_fetcher import WebFetcher
-from src.image_downloader import ImageDownloader
-from src.gemini_api import GeminiAPI
+from src.job_runner import Job
 import logging
 
+# The network and API modules (requests, bs4, google.generativeai, PIL)
+# are imported on first use: see the web_fetcher, image_downloader and
+# gemini_api properties
+
+# Startup benchmark (benchmarks/bench_startup.py)
+_modules_loaded_at = time.time()
+
 __version__ = "0.2.0"
 
+
+def split_tsv_lines(lines):
+    """
+    Split streamed TSV lines into cells with the quoting rules of
+    pd.read_csv(sep='\t'), so that streamed rows match the reloaded TSV.
+    """
+    return list(csv.reader(lines, delimiter='\t'))
+
 class MainController(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -30,14 +46,17 @@ class MainController(QMainWindow):
         self.logger = logging.getLogger(__name__)
         self.data_model = DataModel()
         self.config = ConfigManager()
+        self.data_model.autosaver.delay = self.config.get_ui_param('autosave_delay_ms') / 1000.0
         
         self.calibration_widgets = {} # col_index -> QLineEdit
         self.calibration_labels = {} # col_index -> QLabel
         
-        # Initialize web fetching components
-        self.web_fetcher = WebFetcher()
-        self.image_downloader = ImageDownloader()
-        self.gemini_api = GeminiAPI()
+        # Web fetching components, created on first use
+        self._web_fetcher = None
+        self._image_downloader = None
+        self._gemini_api = None
+        self.fetch_job = None
+        self.streaming_job = None # Fetch job whose rows are shown as they arrive
         
         self.setup_ui()
         self.setup_menu()
@@ -47,6 +66,44 @@ class MainController(QMainWindow):
         
         # Check for updates asynchronously
         self.check_version_async()
+        
+        # Poll autosave status for the status bar
+        self.save_status_label = QLabel()
+        self.statusBar().addPermanentWidget(self.save_status_label)
+        self.save_status_timer = QTimer(self)
+        self.save_status_timer.timeout.connect(self.update_save_status)
+        self.save_status_timer.start(500)
+
+    @property
+    def web_fetcher(self):
+        if self._web_fetcher is None:
+            from src.web_fetcher import WebFetcher
+            self._web_fetcher = WebFetcher()
+        return self._web_fetcher
+
+    @property
+    def image_downloader(self):
+        if self._image_downloader is None:
+            from src.image_downloader import ImageDownloader
+            self._image_downloader = ImageDownloader()
+        return self._image_downloader
+
+    @property
+    def gemini_api(self):
+        if self._gemini_api is None:
+            from src.gemini_api import GeminiAPI
+            self._gemini_api = GeminiAPI()
+            self.apply_transcription_settings()
+        return self._gemini_api
+    
+    def apply_transcription_settings(self):
+        """
+        Apply the upload and band settings to the Gemini client. They are
+        part of the transcription cache key, so every lookup needs them.
+        """
+        from src.image_preprocess import ImagePreprocessor
+        self.gemini_api.preprocessor = ImagePreprocessor(**self.config.get_upload_options())
+        self.gemini_api.set_bands(self.config.get_transcription_bands())
 
     def apply_modern_theme(self):
         """Apply theme using colors from config."""
@@ -231,6 +288,7 @@ class MainController(QMainWindow):
         layout.addWidget(splitter)
         
         # Connect signals
+        self.image_view.set_data_model(self.data_model)
         self.image_view.bboxSelected.connect(self.on_bbox_selected)
         self.image_view.bboxModified.connect(self.on_bbox_modified)
         self.image_view.bboxCreated.connect(self.on_bbox_created)
@@ -238,6 +296,8 @@ class MainController(QMainWindow):
     def setup_shortcuts(self):
         self.undo_shortcut = QShortcut(QKeySequence.Undo, self)
         self.undo_shortcut.activated.connect(self.undo)
+        self.redo_shortcut = QShortcut(QKeySequence.Redo, self)
+        self.redo_shortcut.activated.connect(self.redo)
     
     def setup_menu(self):
         """Setup menu bar with settings."""
@@ -359,6 +419,10 @@ class MainController(QMainWindow):
         self.config = ConfigManager()
         # Reapply theme
         self.apply_modern_theme()
+        self.data_model.autosaver.delay = self.config.get_ui_param('autosave_delay_ms') / 1000.0
+        self.image_view.set_tile_cache_size(self.config.get_ui_param('tile_cache_mb'))
+        if self._gemini_api is not None:
+            self.apply_transcription_settings()
         # Recreate shortcuts (simple approach: restart required for shortcuts)
         # For full dynamic reload, we'd need to store and recreate all QShortcut objects
         QMessageBox = __import__('PySide6.QtWidgets', fromlist=['QMessageBox']).QMessageBox
@@ -369,12 +433,38 @@ class MainController(QMainWindow):
         )
 
     def undo(self):
+        # Table and image are updated through DataModel notifications
         if self.data_model.undo():
             self.logger.info("Undo performed")
-            if hasattr(self, 'model'):
-                self.model.layoutChanged.emit()
-            self.draw_bboxes()
-            self.image_view.scene.update()
+
+    def redo(self):
+        if self.data_model.redo():
+            self.logger.info("Redo performed")
+
+    def closeEvent(self, event):
+        if self.fetch_job is not None:
+            self.fetch_job.cancel()
+            # Let the pipeline reach a cancellation point before the model closes;
+            # a stage blocked in the network is abandoned (daemon thread)
+            if not self.fetch_job.join(timeout=2.0):
+                self.logger.warning("Fetch job still running at exit")
+        # Flush the autosave worker and release the journal before quitting
+        self.data_model.close()
+        super().closeEvent(event)
+
+    def update_save_status(self):
+        """Show the autosave state in the status bar."""
+        last_saved_at, pending, last_error = self.data_model.save_status()
+        if last_error:
+            text = f"Échec de la sauvegarde : {last_error}"
+        elif pending:
+            text = "Sauvegarde en attente..."
+        elif last_saved_at:
+            text = f"Sauvegardé à {time.strftime('%H:%M:%S', time.localtime(last_saved_at))}"
+        else:
+            text = ""
+        if text != self.save_status_label.text():
+            self.save_status_label.setText(text)
 
     def toggle_creation_mode(self, checked):
         self.image_view.creation_mode = checked
@@ -398,8 +488,7 @@ class MainController(QMainWindow):
         self.logger.info(f"Loading {img_path} and {tsv_path}")
         
         # Load Image
-        pixmap = QPixmap(img_path)
-        self.image_view.set_image(pixmap)
+        self.image_view.set_image_file(img_path)
         
         # Store image filepath in data_model
         self.data_model.image_filepath = img_path
@@ -422,8 +511,7 @@ class MainController(QMainWindow):
         self.logger.info(f"Loading image: {img_path}")
         
         # Load Image
-        pixmap = QPixmap(img_path)
-        self.image_view.set_image(pixmap)
+        self.image_view.set_image_file(img_path)
         
         # Store image filepath in data_model
         self.data_model.image_filepath = img_path
@@ -437,7 +525,8 @@ class MainController(QMainWindow):
             self.draw_bboxes()
         tsv_path = os.path.splitext(img_path)[0] + ".tsv"
         if not os.path.exists(tsv_path):
-            tsv_path = None
+            # A deleted TSV can be restored from the transcription cache
+            tsv_path = self.gemini_api.restore_cached_tsv(img_path)
         self.load_tsv(tsv_path)
     
     def load_tsv(self, tsv_path=None):
@@ -456,7 +545,7 @@ class MainController(QMainWindow):
             self.setup_calibration_ui()
             
             # Draw bboxes if image is loaded
-            if not self.image_view.pixmap_item.pixmap().isNull():
+            if self.image_view.has_image():
                 self.draw_bboxes()
         except Exception as e:
             self.logger.error(f"Error loading data: {e}")
@@ -525,17 +614,15 @@ class MainController(QMainWindow):
     def populate_table(self):
         if self.data_model.df is not None:
             from src.pandas_model import PandasModel
+            if hasattr(self, 'model'):
+                self.model.detach()
             self.model = PandasModel(self.data_model) # Pass data_model
             self.table_view.setModel(self.model)
             # Connect selection model
             self.table_view.selectionModel().currentChanged.connect(self.on_table_selection_changed)
 
     def draw_bboxes(self):
-        count = self.data_model.row_count()
-        for i in range(count):
-            bbox = self.data_model.get_bbox(i)
-            if bbox:
-                self.image_view.add_bbox(i, bbox)
+        self.image_view.sync_bboxes(*self.data_model.get_bboxes())
 
     def save_tsv(self):
         try:
@@ -577,14 +664,12 @@ class MainController(QMainWindow):
 
     def on_bbox_modified(self, row_index, bbox):
         self.data_model.update_bbox(row_index, bbox)
-        if hasattr(self, 'model'):
-            self.model.layoutChanged.emit()
 
     def on_bbox_created(self, bbox):
         new_index = self.data_model.add_row(bbox)
-        if hasattr(self, 'model'):
-            self.model.layoutChanged.emit()
-        self.image_view.add_bbox(new_index, bbox)
+        if new_index is None:
+            self.statusBar().showMessage("Attendez la fin de la transcription pour ajouter une ligne.", 3000)
+            return
         # Optional: Select the new row
         self.table_view.selectRow(new_index)
 
@@ -605,15 +690,29 @@ class MainController(QMainWindow):
             row = index.row()
             col = index.column()
             if self.data_model.revert_cell(row, col):
-                if hasattr(self, 'model'):
-                    self.model.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.BackgroundRole])
                 self.logger.info(f"Reverted cell ({row}, {col}) to original value")
     
     def fetch_from_url(self):
         """
         Fetch image from APHP archive URL, download it, send to Gemini API,
         and load the resulting image and TSV.
+        
+        The pipeline runs in a background job: the current page stays
+        editable while the next one is fetched and transcribed.
         """
+        if self.fetch_job is not None and self.fetch_job.is_running():
+            if self.fetch_job.is_cancelled():
+                # The cancelled pipeline may still be downloading or using the API quota
+                message = "La récupération annulée se termine. Réessayez dans un instant."
+            else:
+                message = "Une récupération est déjà en cours."
+            QMessageBox.information(
+                self,
+                "Traitement en cours",
+                message
+            )
+            return
+        
         # Get URL from user
         url, ok = QInputDialog.getText(
             self,
@@ -641,111 +740,169 @@ class MainController(QMainWindow):
         self.image_downloader.set_download_directory(download_dir)
         self.gemini_api.configure(api_key)
         
-        # Create progress dialog
+        # Non-modal progress dialog: the table and image stay usable
         progress = QProgressDialog("Récupération en cours...", "Annuler", 0, 4, self)
-        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setWindowModality(Qt.WindowModality.NonModal)
         progress.setWindowTitle("Traitement")
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+        progress.setValue(0)
         progress.show()
         
-        try:
-            # Step 1: Fetch image URL
-            progress.setLabelText("Extraction de l'URL de l'image...")
-            progress.setValue(1)
-            QApplication.processEvents()
-            
-            image_url, cote, page = self.web_fetcher.fetch_image_url(url)
-            
-            if not image_url:
-                progress.close()
-                QMessageBox.critical(
-                    self,
-                    "Erreur",
-                    "Impossible d'extraire l'URL de l'image depuis la page."
-                )
-                return
-            
-            if progress.wasCanceled():
-                return
-            
-            # Step 2: Download image
-            progress.setLabelText(f"Téléchargement de l'image ({cote}_{page})...")
-            progress.setValue(2)
-            QApplication.processEvents()
-            
-            image_path = self.image_downloader.download_image(image_url, cote, page)
-            
-            if not image_path:
-                progress.close()
-                QMessageBox.critical(
-                    self,
-                    "Erreur",
-                    "Impossible de télécharger l'image."
-                )
+        job = Job(self._fetch_pipeline, url)
+        job.progress.connect(lambda step, label: (progress.setLabelText(label), progress.setValue(step)))
+        job.partial.connect(lambda payload: self.on_fetch_rows(job, payload))
+        job.succeeded.connect(lambda result: (progress.close(), self.on_fetch_finished(job, result)))
+        job.failed.connect(lambda error: (progress.close(), self.on_fetch_failed(job, error)))
+        job.cancelled.connect(lambda: (progress.close(), self.end_streaming(job)))
+        progress.canceled.connect(job.cancel)
+        
+        self.fetch_job = job
+        job.start()
+    
+    def _fetch_pipeline(self, job, url):
+        """
+        Runs on the job thread: resolve, download and transcribe one page.
+        Must not touch widgets.
+        
+        Returns:
+            dict: {"image_path": str, "tsv_path": str or None}
+        """
+        # Step 1: Fetch image URL
+        job.report(1, "Extraction de l'URL de l'image...")
+        image_url, cote, page = self.web_fetcher.fetch_image_url(url)
+        if not image_url:
+            raise RuntimeError("Impossible d'extraire l'URL de l'image depuis la page.")
+        job.check_cancelled()
+        
+        # Step 2: Download image
+        job.report(2, f"Téléchargement de l'image ({cote}_{page})...")
+        image_path = self.image_downloader.download_image(image_url, cote, page, job.cancel_event)
+        if not image_path:
+            raise RuntimeError("Impossible de télécharger l'image.")
+        job.check_cancelled()
+        
+        # Step 3: Send to Gemini API, rows are shown as they are generated
+        job.report(3, "Envoi à l'API Gemini pour transcription...")
+        stream_path = self.gemini_api.tsv_path(image_path)
+        received = [0]
+        
+        def on_lines(lines):
+            received[0] += len(lines)
+            job.report(3, f"Transcription en cours ({received[0]} lignes reçues)...")
+            job.emit_partial({"image_path": image_path, "tsv_path": stream_path, "lines": lines})
+        
+        tsv_path = self.gemini_api.process_image_streaming(image_path, on_lines, job.cancel_event)
+        job.check_cancelled()
+        
+        job.report(4, "Chargement de l'image et du TSV...")
+        return {"image_path": image_path, "tsv_path": tsv_path}
+    
+    def on_fetch_rows(self, job, payload):
+        """
+        Main thread: show transcribed rows as they arrive. Only when no
+        other page is open; otherwise the user is asked at the end.
+        """
+        if job is not self.fetch_job or job.is_cancelled():
+            return
+        
+        lines = payload["lines"]
+        if self.streaming_job is not job:
+            if self.data_model.df is not None:
                 return
             
-            if progress.wasCanceled():
+            # First lines: open the page, the header gives the columns
+            header, lines = lines[0], lines[1:]
+            if not self.data_model.begin_stream(payload["tsv_path"], split_tsv_lines([header])[0]):
                 return
-            
-            # Step 3: Send to Gemini API
-            progress.setLabelText("Envoi à l'API Gemini pour transcription...")
-            progress.setValue(3)
-            QApplication.processEvents()
-            
-            tsv_path = self.gemini_api.process_image(image_path)
-            
+            self.streaming_job = job
+            self.image_view.set_image_file(payload["image_path"])
+            self.data_model.image_filepath = payload["image_path"]
+            self.populate_table()
+            self.setup_calibration_ui()
+        elif not self.data_model.streaming:
+            # Another file was opened meanwhile
+            return
+        
+        self.data_model.append_streamed_rows(split_tsv_lines(lines))
+    
+    def end_streaming(self, job, completed=False):
+        """
+        Main thread: stop appending rows of a finished, failed or cancelled job.
+        completed: True when the whole TSV was received.
+        """
+        if job is self.streaming_job:
+            self.streaming_job = None
+            self.data_model.end_stream(completed)
+            return True
+        return False
+    
+    def on_fetch_failed(self, job, error):
+        self.end_streaming(job)
+        if job is not self.fetch_job or job.is_cancelled():
+            return
+        self.logger.error(f"Error in fetch_from_url: {error}")
+        QMessageBox.critical(
+            self,
+            "Erreur",
+            f"Une erreur s'est produite: {error}"
+        )
+    
+    def on_fetch_finished(self, job, result):
+        """Main thread: offer to open the fetched page."""
+        if job is not self.fetch_job or job.is_cancelled():
+            return
+        
+        image_path = result["image_path"]
+        tsv_path = result["tsv_path"]
+        
+        if self.end_streaming(job, completed=bool(tsv_path)):
+            # The page is already open with all its rows
             if not tsv_path:
-                progress.close()
                 QMessageBox.critical(
                     self,
                     "Erreur",
-                    "Impossible de transcrire l'image via l'API Gemini."
+                    "La transcription via l'API Gemini a été interrompue."
                 )
-                # Still load the image even if transcription failed
-                self.load_image_only(image_path)
-                return
-            
-            if progress.wasCanceled():
-                return
-            
-            # Step 4: Load image and TSV
-            progress.setLabelText("Chargement de l'image et du TSV...")
-            progress.setValue(4)
-            QApplication.processEvents()
-            
-            # Load the image
-            pixmap = QPixmap(image_path)
-            self.image_view.set_image(pixmap)
-            self.data_model.image_filepath = image_path
-            
-            # Load the TSV
-            try:
-                self.data_model.load_data(tsv_path)
-                self.populate_table()
-                self.setup_calibration_ui()
-                self.draw_bboxes()
-            except Exception as e:
-                self.logger.error(f"Error loading TSV data: {e}")
-                QMessageBox.warning(
-                    self,
-                    "Avertissement",
-                    f"Image chargée mais erreur lors du chargement du TSV: {e}"
-                )
-            
-            progress.close()
-            
-            QMessageBox.information(
+            return
+        
+        if not tsv_path:
+            QMessageBox.critical(
+                self,
+                "Erreur",
+                "Impossible de transcrire l'image via l'API Gemini."
+            )
+            # Still load the image even if transcription failed
+            self.load_image_only(image_path)
+            return
+        
+        # The user may be correcting another page: ask before switching
+        if self.data_model.df is not None:
+            reply = QMessageBox.question(
                 self,
                 "Succès",
-                f"Image téléchargée et transcrite avec succès!\n\nImage: {os.path.basename(image_path)}\nTSV: {os.path.basename(tsv_path)}"
+                f"Image téléchargée et transcrite avec succès!\n\nImage: {os.path.basename(image_path)}\nTSV: {os.path.basename(tsv_path)}\n\nOuvrir maintenant ?",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
             )
-            
+            if reply != QMessageBox.StandardButton.Yes:
+                return
+        
+        # Load the image
+        self.image_view.set_image_file(image_path)
+        self.data_model.image_filepath = image_path
+        
+        # Load the TSV
+        try:
+            self.data_model.load_data(tsv_path)
+            self.populate_table()
+            self.setup_calibration_ui()
+            self.draw_bboxes()
         except Exception as e:
-            progress.close()
-            self.logger.error(f"Error in fetch_from_url: {e}")
-            QMessageBox.critical(
+            self.logger.error(f"Error loading TSV data: {e}")
+            QMessageBox.warning(
                 self,
-                "Erreur",
-                f"Une erreur s'est produite: {str(e)}"
+                "Avertissement",
+                f"Image chargée mais erreur lors du chargement du TSV: {e}"
             )
     
     def load_image_only(self, image_path):
@@ -755,8 +912,7 @@ class MainController(QMainWindow):
         Args:
             image_path (str): Path to the image file
         """
-        pixmap = QPixmap(image_path)
-        self.image_view.set_image(pixmap)
+        self.image_view.set_image_file(image_path)
         self.data_model.image_filepath = image_path
         self.logger.info(f"Loaded image: {image_path}")
 
@@ -765,4 +921,16 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = MainController()
     window.show()
+    
+    probe_path = os.environ.get("THOTINDEX_STARTUP_PROBE")
+    if probe_path:
+        # Startup benchmark: record the timings once the event loop runs, then quit
+        window_created_at = time.time()
+        def report_startup():
+            with open(probe_path, 'w') as f:
+                json.dump({"modules_loaded": _modules_loaded_at, "window_created": window_created_at,
+                           "first_window": time.time()}, f)
+            app.quit()
+        QTimer.singleShot(0, report_startup)
+    
     sys.exit(app.exec())
@@ -1,5 +1,5 @@
-from PySide6.QtCore import QAbstractTableModel, Qt
-import pandas as pd
+from PySide6.QtCore import QAbstractTableModel, Qt, QModelIndex
+import numpy as np
 
 from PySide6.QtGui import QColor
 from src.config_manager import ConfigManager
@@ -8,7 +8,70 @@ class PandasModel(QAbstractTableModel):
     def __init__(self, data_model):
         super().__init__()
         self.data_model = data_model
-        self._data = data_model.df
+        # Column-major display strings: self._display[col][row]
+        self._display = None
+        self.data_model.add_listener(self)
+
+    @property
+    def _data(self):
+        # Always follow DataModel.df, which is replaced when rows are added or undone
+        return self.data_model.df
+
+    def detach(self):
+        """Stop receiving DataModel notifications (model is being replaced)."""
+        self.data_model.remove_listener(self)
+
+    @staticmethod
+    def _strings(frame):
+        """Returns frame as a column-major object array of display strings."""
+        frame = frame.astype(object).where(frame.notna(), "")
+        return frame.astype(str).to_numpy(dtype=object).T.copy()
+
+    def _display_cache(self):
+        """
+        Returns the display string cache, rebuilding it if the shape changed.
+        """
+        rows, cols = self._data.shape
+        if self._display is None or self._display.shape != (cols, rows):
+            self._display = self._strings(self._data)
+        return self._display
+
+    # DataModel notifications
+
+    def cells_changed(self, top, left, bottom, right):
+        if self._display is not None:
+            block = self._data.iloc[top:bottom + 1, left:right + 1]
+            self._display[left:right + 1, top:bottom + 1] = self._strings(block)
+        self.dataChanged.emit(self.index(top, left), self.index(bottom, right),
+                              [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole,
+                               Qt.ItemDataRole.BackgroundRole])
+
+    def rows_about_to_be_inserted(self, first, last):
+        self.beginInsertRows(QModelIndex(), first, last)
+
+    def rows_inserted(self, first, last):
+        if self._display is not None:
+            new_rows = self._strings(self._data.iloc[first:last + 1])
+            self._display = np.concatenate(
+                [self._display[:, :first], new_rows, self._display[:, first:]], axis=1)
+        self.endInsertRows()
+
+    def rows_about_to_be_removed(self, first, last):
+        self.beginRemoveRows(QModelIndex(), first, last)
+
+    def rows_removed(self, first, last):
+        if self._display is not None:
+            self._display = np.delete(self._display, np.s_[first:last + 1], axis=1)
+        self.endRemoveRows()
+
+    def model_about_to_be_reset(self):
+        self.beginResetModel()
+
+    def model_reset(self):
+        self._display = None
+        self.endResetModel()
+
+    # Qt model interface
 
     def rowCount(self, parent=None):
         return self._data.shape[0]
@@ -19,10 +82,7 @@ class PandasModel(QAbstractTableModel):
     def data(self, index, role=Qt.ItemDataRole.DisplayRole):
         if index.isValid():
             if role == Qt.ItemDataRole.DisplayRole or role == Qt.ItemDataRole.EditRole:
-                val = self._data.iloc[index.row(), index.column()]
-                if pd.isna(val):
-                    return ""
-                return str(val)
+                return self._display_cache()[index.column(), index.row()]
             
             if role == Qt.ItemDataRole.BackgroundRole:
                 if self.data_model.is_modified(index.row(), index.column()):
@@ -32,9 +92,8 @@ class PandasModel(QAbstractTableModel):
 
     def setData(self, index, value, role):
         if role == Qt.ItemDataRole.EditRole:
-            # self._data.iloc[index.row(), index.column()] = value
+            # DataModel notifies cells_changed, which emits dataChanged
             self.data_model.update_cell(index.row(), index.column(), value)
-            self.dataChanged.emit(index, index, [role, Qt.ItemDataRole.BackgroundRole])
             return True
         return False
 
@@ -0,0 +1,82 @@
+"""
+Rate limiting and retry helpers shared by the network clients.
+"""
+import time
+import random
+import threading
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, up to `burst` saved.
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        Args:
+            rate (float): Tokens added per second (<= 0 disables limiting)
+            burst (int): Maximum number of tokens available at once
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cancel_event=None):
+        """
+        Block until a token is available.
+
+        Returns:
+            bool: False if cancel_event was set while waiting
+        """
+        if self.rate <= 0:
+            return True
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if cancel_event is not None:
+                if cancel_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+class HostRateLimiter:
+    """One TokenBucket per URL host."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url, cancel_event=None):
+        host = urlparse(url).netloc
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return bucket.acquire(cancel_event)
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """
+    Exponential backoff with full jitter for retry number `attempt` (0-based).
+
+    Returns:
+        float: Seconds to wait
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def is_retryable_status(status_code):
+    """True for HTTP statuses worth retrying (throttling and server errors)."""
+    return status_code == 429 or status_code >= 500
@@ -1,7 +1,8 @@
 from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTabWidget, 
                                QWidget, QPushButton, QLabel, QLineEdit, QSlider,
                                QColorDialog, QFormLayout, QScrollArea, QMessageBox,
-                               QKeySequenceEdit, QFileDialog)
+                               QKeySequenceEdit, QFileDialog, QSpinBox, QComboBox,
+                               QCheckBox)
 from PySide6.QtCore import Qt, Signal
 from PySide6.QtGui import QColor, QKeySequence
 from src.config_manager import ConfigManager
@@ -320,6 +321,36 @@ class SettingsDialog(QDialog):
         self.ui_widgets["bbox_resize_margin"] = margin_slider
         layout.addRow("Marge de redimensionnement BBox:", margin_layout)
         
+        # Autosave delay
+        autosave_slider = QSlider(Qt.Orientation.Horizontal)
+        autosave_slider.setRange(200, 10000)
+        autosave_slider.setSingleStep(100)
+        autosave_slider.setValue(1500)
+        autosave_label = QLabel("1500 ms")
+        autosave_slider.valueChanged.connect(lambda v: autosave_label.setText(f"{v} ms"))
+        
+        autosave_layout = QHBoxLayout()
+        autosave_layout.addWidget(autosave_slider)
+        autosave_layout.addWidget(autosave_label)
+        
+        self.ui_widgets["autosave_delay_ms"] = autosave_slider
+        layout.addRow("Délai de sauvegarde auto:", autosave_layout)
+        
+        # Memory of the tiles of large scans
+        tile_cache_slider = QSlider(Qt.Orientation.Horizontal)
+        tile_cache_slider.setRange(64, 2048)
+        tile_cache_slider.setSingleStep(64)
+        tile_cache_slider.setValue(256)
+        tile_cache_label = QLabel("256 Mo")
+        tile_cache_slider.valueChanged.connect(lambda v: tile_cache_label.setText(f"{v} Mo"))
+        
+        tile_cache_layout = QHBoxLayout()
+        tile_cache_layout.addWidget(tile_cache_slider)
+        tile_cache_layout.addWidget(tile_cache_label)
+        
+        self.ui_widgets["tile_cache_mb"] = tile_cache_slider
+        layout.addRow("Mémoire des tuiles d'image:", tile_cache_layout)
+        
         container = QWidget()
         container_layout = QVBoxLayout(container)
         container_layout.addWidget(widget)
@@ -358,6 +389,40 @@ class SettingsDialog(QDialog):
         
         layout.addRow("Répertoire de téléchargement:", download_dir_layout)
         
+        # Image sent to Gemini
+        self.upload_max_edge_input = QSpinBox()
+        self.upload_max_edge_input.setRange(0, 20000)
+        self.upload_max_edge_input.setSingleStep(256)
+        self.upload_max_edge_input.setSuffix(" px")
+        self.upload_max_edge_input.setSpecialValueText("Taille d'origine")
+        layout.addRow("Grand côté maximal envoyé:", self.upload_max_edge_input)
+        
+        self.upload_format_input = QComboBox()
+        self.upload_format_input.addItems(["JPEG", "WEBP", "PNG"])
+        self.upload_quality_input = QSpinBox()
+        self.upload_quality_input.setRange(1, 100)
+        self.upload_format_input.currentTextChanged.connect(
+            lambda fmt: self.upload_quality_input.setEnabled(fmt != "PNG"))
+        
+        upload_format_layout = QHBoxLayout()
+        upload_format_layout.addWidget(self.upload_format_input)
+        upload_format_layout.addWidget(QLabel("Qualité:"))
+        upload_format_layout.addWidget(self.upload_quality_input)
+        layout.addRow("Format d'envoi:", upload_format_layout)
+        
+        self.upload_grayscale_input = QCheckBox("Niveaux de gris")
+        self.upload_autocontrast_input = QCheckBox("Normaliser le contraste")
+        upload_options_layout = QHBoxLayout()
+        upload_options_layout.addWidget(self.upload_grayscale_input)
+        upload_options_layout.addWidget(self.upload_autocontrast_input)
+        layout.addRow("Prétraitement:", upload_options_layout)
+        
+        self.transcription_bands_input = QSpinBox()
+        self.transcription_bands_input.setRange(1, 8)
+        self.transcription_bands_input.setSpecialValueText("Page entière")
+        self.transcription_bands_input.setSuffix(" bandes")
+        layout.addRow("Transcription en parallèle:", self.transcription_bands_input)
+        
         container = QWidget()
         container_layout = QVBoxLayout(container)
         container_layout.addWidget(widget)
@@ -393,10 +458,20 @@ class SettingsDialog(QDialog):
         zoom_factor = self.config.get_ui_param("zoom_factor")
         self.ui_widgets["zoom_factor"].setValue(int(zoom_factor * 100))
         self.ui_widgets["bbox_resize_margin"].setValue(self.config.get_ui_param("bbox_resize_margin"))
+        self.ui_widgets["autosave_delay_ms"].setValue(self.config.get_ui_param("autosave_delay_ms"))
+        self.ui_widgets["tile_cache_mb"].setValue(self.config.get_ui_param("tile_cache_mb"))
         
         # Load API settings
         self.api_key_input.setText(self.config.get_api_key())
         self.download_dir_input.setText(self.config.get_download_directory())
+        upload = self.config.get_upload_options()
+        self.upload_max_edge_input.setValue(upload["max_edge"])
+        self.upload_format_input.setCurrentText(upload["format"])
+        self.upload_quality_input.setValue(upload["quality"])
+        self.upload_quality_input.setEnabled(upload["format"] != "PNG")
+        self.upload_grayscale_input.setChecked(upload["grayscale"])
+        self.upload_autocontrast_input.setChecked(upload["autocontrast"])
+        self.transcription_bands_input.setValue(self.config.get_transcription_bands())
     
     def choose_color(self, color_name):
         """Open color picker dialog."""
@@ -451,10 +526,20 @@ class SettingsDialog(QDialog):
         self.config.update_ui_param("pan_step", self.ui_widgets["pan_step"].value())
         self.config.update_ui_param("zoom_factor", self.ui_widgets["zoom_factor"].value() / 100.0)
         self.config.update_ui_param("bbox_resize_margin", self.ui_widgets["bbox_resize_margin"].value())
+        self.config.update_ui_param("autosave_delay_ms", self.ui_widgets["autosave_delay_ms"].value())
+        self.config.update_ui_param("tile_cache_mb", self.ui_widgets["tile_cache_mb"].value())
         
         # Save API settings
         self.config.set_api_key(self.api_key_input.text())
         self.config.set_download_directory(self.download_dir_input.text())
+        self.config.set_upload_options(
+            self.upload_max_edge_input.value(),
+            self.upload_grayscale_input.isChecked(),
+            self.upload_autocontrast_input.isChecked(),
+            self.upload_format_input.currentText(),
+            self.upload_quality_input.value()
+        )
+        self.config.set_transcription_bands(self.transcription_bands_input.value())
         
         self.settings_changed.emit()
         self.accept()
@@ -0,0 +1,326 @@
+"""
+Multi-resolution tile pyramid of a page scan, for displaying very large
+images with bounded memory.
+
+Level 0 is the full resolution and each next level halves it, down to a
+level that fits in one tile. Every level is cut into square JPEG tiles
+stored on disk once; the viewer then only loads the tiles it shows, at
+the level matching the zoom, into an LRU cache of pixmaps.
+"""
+import os
+import math
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from PySide6.QtCore import Qt, QObject, Signal
+from PySide6.QtGui import QImage, QImageReader
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 512
+TILE_QUALITY = 90
+PYRAMID_VERSION = 1
+MAX_PYRAMIDS = 20  # Pyramids kept on disk, least recently used are removed
+COMPLETE_MARKER = "complete"
+
+
+def image_size(image_path):
+    """Returns (width, height) of an image file without decoding it, (0, 0) if unreadable."""
+    size = QImageReader(image_path).size()
+    if not size.isValid():
+        return 0, 0
+    return size.width(), size.height()
+
+
+def load_preview(image_path, max_edge):
+    """
+    Decode an image downscaled to at most max_edge pixels on its long edge.
+    JPEG is decoded directly at the reduced size, which is much faster and
+    smaller than decoding the full scan.
+
+    Returns:
+        QImage: Preview (null if unreadable)
+    """
+    reader = QImageReader(image_path)
+    size = reader.size()
+    if size.isValid() and max(size.width(), size.height()) > max_edge:
+        reader.setScaledSize(size.scaled(max_edge, max_edge, Qt.AspectRatioMode.KeepAspectRatio))
+    return reader.read()
+
+
+class TilePyramid:
+    """
+    Tile pyramid of one image file, stored in its own directory under
+    cache_root: <level>/<col>_<row>.jpg plus a marker written last. The
+    directory name depends on the file path, size and modification time,
+    so an image replaced on disk gets a new pyramid.
+    """
+
+    def __init__(self, image_path, cache_root, tile_size=TILE_SIZE):
+        """
+        Args:
+            image_path (str): Image file
+            cache_root (str): Directory holding the pyramids
+            tile_size (int): Tile edge in pixels
+        """
+        self.image_path = image_path
+        self.cache_root = cache_root
+        self.tile_size = tile_size
+        self.width, self.height = image_size(image_path)
+
+        stat = os.stat(image_path)
+        identity = f"{os.path.abspath(image_path)}|{stat.st_size}|{stat.st_mtime_ns}|{tile_size}|{PYRAMID_VERSION}"
+        self.key = hashlib.sha1(identity.encode('utf-8')).hexdigest()
+        self.directory = os.path.join(cache_root, self.key)
+
+        # Halve until the whole image fits in one tile
+        longest = max(self.width, self.height, 1)
+        self.levels = max(0, math.ceil(math.log2(longest / tile_size))) + 1
+
+    def level_size(self, level):
+        """Returns (width, height) of the image at level."""
+        factor = 2 ** level
+        return max(1, math.ceil(self.width / factor)), max(1, math.ceil(self.height / factor))
+
+    def grid(self, level):
+        """Returns (columns, rows) of tiles at level."""
+        width, height = self.level_size(level)
+        return math.ceil(width / self.tile_size), math.ceil(height / self.tile_size)
+
+    def level_for_scale(self, scale):
+        """
+        Coarsest level whose resolution is still at least the displayed one.
+
+        Args:
+            scale (float): Screen pixels per full resolution image pixel
+        """
+        if scale <= 0:
+            return self.levels - 1
+        level = math.floor(-math.log2(scale)) if scale < 1 else 0
+        return max(0, min(self.levels - 1, level))
+
+    def tile_rect(self, level, col, row):
+        """Returns (x, y, width, height) covered by a tile, in full resolution pixels."""
+        factor = 2 ** level
+        span = self.tile_size * factor
+        x = col * span
+        y = row * span
+        return x, y, min(span, self.width - x), min(span, self.height - y)
+
+    def tiles_in_rect(self, level, left, top, right, bottom):
+        """Returns the (col, row) of the tiles of level intersecting a full resolution rectangle."""
+        span = self.tile_size * 2 ** level
+        cols, rows = self.grid(level)
+        first_col = max(0, int(left // span))
+        last_col = min(cols - 1, int(math.ceil(right / span)) - 1)
+        first_row = max(0, int(top // span))
+        last_row = min(rows - 1, int(math.ceil(bottom / span)) - 1)
+        return [(col, row) for row in range(first_row, last_row + 1) for col in range(first_col, last_col + 1)]
+
+    def tile_path(self, level, col, row, directory=None):
+        return os.path.join(directory or self.directory, str(level), f"{col}_{row}.jpg")
+
+    def is_built(self):
+        return os.path.exists(os.path.join(self.directory, COMPLETE_MARKER))
+
+    def touch(self):
+        """Mark the pyramid as recently used (see prune_pyramids)."""
+        try:
+            os.utime(self.directory)
+        except OSError:
+            pass
+
+    def load_tile(self, level, col, row):
+        """Decode one tile. Safe to call from any thread. Returns a QImage (null if missing)."""
+        return QImage(self.tile_path(level, col, row))
+
+    def build(self, cancel_event=None):
+        """
+        Decode the image once and write every level. Runs on a worker thread.
+        The tiles are written to a temporary directory renamed when complete,
+        so an interrupted build leaves nothing half written behind.
+
+        Args:
+            cancel_event (threading.Event): Stops the build when set
+
+        Returns:
+            bool: True if built, False if cancelled. Raises on read/write errors.
+        """
+        if self.is_built():
+            return True
+
+        # Qt refuses to decode images above 256 MB by default: 100+ MP scans exceed it
+        needed_mb = self.width * self.height * 4 // (1024 * 1024) + 1
+        limit = QImageReader.allocationLimit()
+        if limit and limit < needed_mb:
+            QImageReader.setAllocationLimit(needed_mb)
+
+        started = time.time()
+        reader = QImageReader(self.image_path)
+        img = reader.read()
+        if img.isNull():
+            raise ValueError(f"Cannot read {self.image_path}: {reader.errorString()}")
+        img.convertTo(QImage.Format.Format_Grayscale8 if img.isGrayscale() else QImage.Format.Format_RGB888)
+
+        tmp_dir = f"{self.directory}.tmp{os.getpid()}_{threading.get_ident()}"
+        try:
+            for level in range(self.levels):
+                os.makedirs(os.path.join(tmp_dir, str(level)), exist_ok=True)
+                cols, rows = self.grid(level)
+                for row in range(rows):
+                    for col in range(cols):
+                        if cancel_event is not None and cancel_event.is_set():
+                            shutil.rmtree(tmp_dir, ignore_errors=True)
+                            return False
+                        x, y = col * self.tile_size, row * self.tile_size
+                        tile = img.copy(x, y, min(self.tile_size, img.width() - x), min(self.tile_size, img.height() - y))
+                        path = self.tile_path(level, col, row, tmp_dir)
+                        if not tile.save(path, "JPEG", TILE_QUALITY):
+                            raise OSError(f"Cannot write tile {path}")
+                if level < self.levels - 1:
+                    width, height = self.level_size(level + 1)
+                    img = img.scaled(width, height, Qt.AspectRatioMode.IgnoreAspectRatio,
+                                     Qt.TransformationMode.SmoothTransformation)
+            del img
+
+            with open(os.path.join(tmp_dir, COMPLETE_MARKER), 'w') as f:
+                f.write(f"{self.width}x{self.height} {self.levels} levels\n")
+            if os.path.exists(self.directory):
+                # Built meanwhile by another viewer, or left incomplete
+                shutil.rmtree(self.directory, ignore_errors=True)
+            os.replace(tmp_dir, self.directory)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        logger.info(f"Built {self.levels}-level tile pyramid of {os.path.basename(self.image_path)} "
+                    f"({self.width}x{self.height}) in {time.time() - started:.1f}s")
+        prune_pyramids(self.cache_root, keep=MAX_PYRAMIDS)
+        return True
+
+
+def prune_pyramids(cache_root, keep=MAX_PYRAMIDS):
+    """Remove all but the `keep` most recently used pyramids under cache_root."""
+    try:
+        entries = [os.path.join(cache_root, name) for name in os.listdir(cache_root)]
+    except OSError:
+        return
+    pyramids = sorted((path for path in entries if os.path.isdir(path) and '.tmp' not in os.path.basename(path)),
+                      key=os.path.getmtime, reverse=True)
+    for path in pyramids[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+        logger.info(f"Removed tile pyramid {os.path.basename(path)}")
+
+
+class TileCache:
+    """
+    LRU cache of tile pixmaps bounded by their total size in bytes.
+    Keys are (pyramid key, level, col, row). Main thread only.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._tiles = OrderedDict()
+
+    def get(self, key):
+        pixmap = self._tiles.get(key)
+        if pixmap is not None:
+            self._tiles.move_to_end(key)
+        return pixmap
+
+    def put(self, key, pixmap):
+        old = self._tiles.pop(key, None)
+        if old is not None:
+            self.bytes -= self._cost(old)
+        self._tiles[key] = pixmap
+        self.bytes += self._cost(pixmap)
+        self._evict()
+
+    def set_max_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def clear(self):
+        self._tiles.clear()
+        self.bytes = 0
+
+    def _evict(self):
+        # The most recent tile is always kept
+        while self.bytes > self.max_bytes and len(self._tiles) > 1:
+            _, pixmap = self._tiles.popitem(last=False)
+            self.bytes -= self._cost(pixmap)
+
+    @staticmethod
+    def _cost(pixmap):
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    def __len__(self):
+        return len(self._tiles)
+
+
+class TileLoader(QObject):
+    """
+    Decodes tiles on worker threads and delivers them to the main thread
+    through tile_loaded(key, QImage).
+
+    Requests are served newest first, since those are the tiles on screen
+    after a fast pan or zoom, and only the `max_pending` newest are kept.
+    """
+
+    tile_loaded = Signal(object, object)  # (pyramid key, level, col, row), QImage
+
+    def __init__(self, workers=2, max_pending=256):
+        super().__init__()
+        self.workers = workers
+        self.max_pending = max_pending
+        self._queue = deque()
+        self._queued = set()
+        self._condition = threading.Condition()
+        self._threads = []
+
+    def request(self, pyramid, level, col, row):
+        """Queue a tile for loading (ignored if already queued or loading)."""
+        key = (pyramid.key, level, col, row)
+        with self._condition:
+            if key in self._queued:
+                return
+            self._queue.append((key, pyramid))
+            self._queued.add(key)
+            while len(self._queue) > self.max_pending:
+                dropped, _ = self._queue.popleft()
+                self._queued.discard(dropped)
+            self._condition.notify()
+        self._start_workers()
+
+    def clear(self):
+        """Drop the pending requests (e.g. when another image is shown)."""
+        with self._condition:
+            for key, _ in self._queue:
+                self._queued.discard(key)
+            self._queue.clear()
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name="TileLoader", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                key, pyramid = self._queue.pop()
+            try:
+                image = pyramid.load_tile(*key[1:])
+            except Exception as e:
+                logger.error(f"Error loading tile {key}: {e}")
+                image = None
+            with self._condition:
+                self._queued.discard(key)
+            if image is not None and not image.isNull():
+                self.tile_loaded.emit(key, image)
@@ -0,0 +1,111 @@
+"""
+Persistent cache of Gemini transcriptions keyed by image, prompt and model.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def transcription_key(image_sha256, prompt, model_name, variant=""):
+    """
+    Cache key: SHA-256 of the image bytes, SHA-256 of the prompt, model name
+    and an optional variant (upload preprocessing options).
+    """
+    prompt_sha256 = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    key = f"{image_sha256}:{prompt_sha256}:{model_name}"
+    return f"{key}:{variant}" if variant else key
+
+
+class TranscriptionCache:
+    """
+    SQLite store of TSV responses, capped at max_bytes of TSV text and
+    evicting the least recently used entries first.
+    """
+
+    def __init__(self, path, max_bytes=200 * 1024 * 1024):
+        """
+        Args:
+            path (str): SQLite file
+            max_bytes (int): Maximum total size of cached TSV text
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS transcriptions (
+                    key TEXT PRIMARY KEY,
+                    tsv TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS transcriptions_last_used ON transcriptions (last_used);
+            """)
+        return self._conn
+
+    def exists(self):
+        """False until the first transcription is stored (nothing to look up)."""
+        return self._conn is not None or os.path.exists(self.path)
+
+    def get(self, key):
+        """Returns the cached TSV for key, or None."""
+        if not self.exists():
+            return None
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute("SELECT tsv FROM transcriptions WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute("UPDATE transcriptions SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+                return row[0]
+        except sqlite3.Error as e:
+            logger.error(f"Transcription cache read failed: {e}")
+            return None
+
+    def put(self, key, tsv):
+        """Store a TSV and evict old entries beyond max_bytes."""
+        size = len(tsv.encode('utf-8'))
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO transcriptions (key, tsv, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, tsv, size, time.time())
+                )
+                self._evict(conn)
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Transcription cache write failed: {e}")
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcriptions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM transcriptions ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM transcriptions WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} cached transcriptions")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,172 @@
+"""
+Bounded-concurrency job queue for Gemini transcriptions.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.rate_limit import TokenBucket, backoff_delay, is_retryable_status
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionCancelled(Exception):
+    """Raised by TranscriptionJob.result() for a cancelled job."""
+
+
+class TranscriptionJob:
+    """Handle on one queued transcription."""
+
+    def __init__(self, image_path):
+        self.image_path = image_path
+        self.status = "queued"  # queued, running, done, failed, cancelled
+        self.tsv_path = None
+        self.error = None
+        self.attempts = 0
+        self.cancel_event = threading.Event()
+        self._done = threading.Event()
+
+    def cancel(self):
+        """
+        Cancel the job. A queued job never starts; a running API call cannot
+        be interrupted, its result is discarded.
+        """
+        self.cancel_event.set()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the job.
+
+        Returns:
+            str: Path of the saved TSV, or None if the transcription failed
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Transcription of {self.image_path} still running")
+        if self.status == "cancelled":
+            raise TranscriptionCancelled(self.image_path)
+        return self.tsv_path
+
+    def _finish(self, status, tsv_path=None, error=None):
+        self.status = status
+        self.tsv_path = tsv_path
+        self.error = error
+        self._done.set()
+
+
+def _is_retryable(error):
+    # google.api_core exceptions carry the HTTP status in `code`
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return is_retryable_status(code)
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+class TranscriptionQueue:
+    """
+    Runs GeminiAPI transcriptions on a thread pool, limited to
+    `requests_per_minute` API calls, retrying 429/5xx with backoff.
+    """
+
+    def __init__(self, gemini_api, workers=4, requests_per_minute=10, max_retries=4, timeout=600):
+        """
+        Args:
+            gemini_api (GeminiAPI): Configured API client
+            workers (int): Concurrent transcriptions
+            requests_per_minute (float): API call rate limit (<= 0 to disable)
+            max_retries (int): Retries for throttled or failed calls
+            timeout (float): Per-request timeout in seconds
+        """
+        self.gemini_api = gemini_api
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.rate_limiter = TokenBucket(requests_per_minute / 60.0, burst=1)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="Transcription")
+
+    def submit(self, image_path):
+        """
+        Queue an image for transcription; its TSV is saved next to it.
+
+        Returns:
+            TranscriptionJob
+        """
+        job = TranscriptionJob(image_path)
+        self._executor.submit(self._run, job)
+        return job
+
+    def transcribe(self, image_path):
+        """Queue an image and wait for it. Returns the TSV path or None."""
+        return self.submit(image_path).result()
+
+    def process_all(self, image_paths, progress_callback=None):
+        """
+        Transcribe many images.
+
+        Args:
+            image_paths (list): Images to transcribe
+            progress_callback (callable): Called as progress_callback(done, total, job)
+                on the calling thread after each job
+
+        Returns:
+            list: TranscriptionJob per image, in order
+        """
+        jobs = [self.submit(path) for path in image_paths]
+        for done, job in enumerate(jobs, 1):
+            job._done.wait()
+            if progress_callback is not None:
+                progress_callback(done, len(jobs), job)
+        return jobs
+
+    def shutdown(self, cancel_pending=True):
+        self._executor.shutdown(wait=not cancel_pending, cancel_futures=cancel_pending)
+
+    def _run(self, job):
+        try:
+            if job.cancelled():
+                job._finish("cancelled")
+                return
+
+            # Cached results cost neither a rate limit token nor an API call
+            tsv_content = self.gemini_api.cached_transcription(job.image_path)
+            if tsv_content:
+                tsv_path = self.gemini_api.save_tsv(tsv_content, job.image_path)
+                job._finish("done" if tsv_path else "failed", tsv_path)
+                return
+
+            for attempt in range(self.max_retries + 1):
+                # One token per API call: band-split pages make several
+                acquired = all(self.rate_limiter.acquire(job.cancel_event)
+                               for _ in range(self.gemini_api.requests_per_page))
+                if job.cancelled() or not acquired:
+                    job._finish("cancelled")
+                    return
+                job.status = "running"
+                job.attempts += 1
+                try:
+                    tsv_content = self.gemini_api.generate_tsv(job.image_path, timeout=self.timeout)
+                    break
+                except Exception as e:
+                    if attempt == self.max_retries or not _is_retryable(e):
+                        raise
+                    delay = backoff_delay(attempt, base=5.0, cap=120.0)
+                    logger.warning(f"Transcription of {job.image_path} failed ({e}), "
+                                   f"retrying in {delay:.0f}s (attempt {attempt + 1}/{self.max_retries})")
+                    if job.cancel_event.wait(delay):
+                        job._finish("cancelled")
+                        return
+
+            if job.cancelled():
+                job._finish("cancelled")
+            elif not tsv_content:
+                job._finish("failed", error="Empty transcription")
+            else:
+                tsv_path = self.gemini_api.save_tsv(tsv_content, job.image_path)
+                job._finish("done" if tsv_path else "failed", tsv_path)
+        except Exception as e:
+            logger.error(f"Error transcribing {job.image_path}: {e}")
+            job._finish("failed", error=str(e))
@@ -0,0 +1,134 @@
+"""
+Pluggable HTTP transports: route the archive and image requests to a
+local server, and call the Gemini REST API without the SDK.
+"""
+import json
+import base64
+import logging
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class LocalRedirectAdapter(HTTPAdapter):
+    """
+    requests transport adapter sending every request to one server:
+    https://host/path?query becomes <base_url>/https/host/path?query.
+    Mount it on a session with mount_transport().
+    """
+
+    def __init__(self, base_url, pool_size=8):
+        """
+        Args:
+            base_url (str): Server receiving the requests, e.g. "http://127.0.0.1:8765"
+            pool_size (int): HTTP connections kept to the server
+        """
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.base_url = base_url.rstrip('/')
+
+    def send(self, request, **kwargs):
+        if not request.url.startswith(self.base_url + '/'):
+            parts = urlsplit(request.url)
+            query = f"?{parts.query}" if parts.query else ""
+            request.url = f"{self.base_url}/{parts.scheme}/{parts.netloc}{parts.path or '/'}{query}"
+        return super().send(request, **kwargs)
+
+
+def mount_transport(session, adapter):
+    """Use adapter for all http:// and https:// requests of a requests session."""
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+
+class GeminiHttpError(Exception):
+    """HTTP error from the Gemini REST API; `code` holds the status like SDK errors."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class _TextResponse:
+    """The part of the SDK response used by GeminiAPI."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+def _response_text(data):
+    candidates = data.get('candidates') or [{}]
+    parts = candidates[0].get('content', {}).get('parts', [])
+    return ''.join(part.get('text', '') for part in parts)
+
+
+class HttpGenerativeModel:
+    """
+    Calls generateContent / streamGenerateContent of the Gemini REST API
+    with requests. Has the generate_content() interface that GeminiAPI
+    uses on the SDK model, so it can replace it to talk to a proxy or a
+    local stand-in server.
+    """
+
+    def __init__(self, endpoint, model_name, api_key, session=None):
+        """
+        Args:
+            endpoint (str): API root, e.g. "https://generativelanguage.googleapis.com"
+            model_name (str): Model to call
+            api_key (str): Gemini API key
+            session (requests.Session): Session to use (a new one by default)
+        """
+        self.endpoint = endpoint.rstrip('/')
+        self.model_name = model_name
+        self.api_key = api_key
+        self.session = session or requests.Session()
+
+    def _parts(self, contents):
+        parts = []
+        for content in contents:
+            if isinstance(content, str):
+                parts.append({"text": content})
+            else:
+                parts.append({"inline_data": {
+                    "mime_type": content["mime_type"],
+                    "data": base64.b64encode(content["data"]).decode('ascii'),
+                }})
+        return parts
+
+    def generate_content(self, contents, request_options=None, stream=False):
+        """
+        Args:
+            contents (list): Prompt strings and {"mime_type", "data"} images
+            request_options (dict): {"timeout": seconds}
+            stream (bool): Return an iterator of partial responses
+
+        Returns:
+            Response with a `text` attribute, or an iterator of them when streaming.
+            Raises GeminiHttpError on HTTP errors.
+        """
+        method = "streamGenerateContent?alt=sse" if stream else "generateContent"
+        url = f"{self.endpoint}/v1beta/models/{self.model_name}:{method}"
+        body = {"contents": [{"role": "user", "parts": self._parts(contents)}]}
+        timeout = (request_options or {}).get("timeout")
+
+        response = self.session.post(url, json=body, headers={"x-goog-api-key": self.api_key},
+                                     timeout=timeout, stream=stream)
+        if response.status_code >= 400:
+            try:
+                message = response.json().get('error', {}).get('message', response.reason)
+            except ValueError:
+                message = response.reason
+            response.close()
+            raise GeminiHttpError(response.status_code, message)
+
+        if not stream:
+            return _TextResponse(_response_text(response.json()))
+        return self._events(response)
+
+    def _events(self, response):
+        # Server-sent events: one "data: {json}" line per partial response
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith('data:'):
+                    yield _TextResponse(_response_text(json.loads(line[5:])))
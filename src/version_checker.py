@@ -1,4 +1,3 @@
-import requests
 import logging
 from packaging import version as pkg_version
 
@@ -15,6 +14,9 @@ def check_for_updates(current_version):
     """
     logger = logging.getLogger(__name__)
     
+    # Imported here (on the version check thread) so that it does not slow down startup
+    import requests
+    
     try:
         # GitHub API endpoint for latest release
         url = "https://api.github.com/repos/Sidam31/ThotIndex/releases/latest"
@@ -1,29 +1,295 @@
 """
 Module to fetch image URLs from APHP archive website.
 """
+import os
 import re
+import time
+import hashlib
+import threading
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse, unquote
 import logging
 import json
 
+from src.autosave import write_atomic
+from src.transport import mount_transport
+
 logger = logging.getLogger(__name__)
 
 
+# "source":"https:\/\/...BIN_xxx.json?..." inside the Binocle configuration script
+BINOCLE_SOURCE_RE = re.compile(rb'"source"\s*:\s*"(https?:[^"]+\.json[^"]*)"')
+
+
+class BinocleUrlScanner:
+    """
+    Finds the Binocle JSON URL by scanning raw page bytes chunk by chunk,
+    without building a DOM. Like the BeautifulSoup fallback, only accepts
+    the first "source" URL of a <script> body that mentions binocle.
+    Stops at the first match.
+    """
+    
+    def __init__(self):
+        self.buffer = b"" # Page bytes from the first script not fully scanned
+        self.result = None
+    
+    def feed(self, chunk):
+        """
+        Scan the next chunk of the page.
+        
+        Returns:
+            str: Binocle JSON URL once found, else None
+        """
+        if self.result:
+            return self.result
+        
+        self.buffer += chunk
+        lower = self.buffer.lower()
+        pos = 0
+        while True:
+            start = lower.find(b'<script', pos)
+            if start == -1:
+                # Keep the tail: it may hold the beginning of a split "<script" tag
+                self.buffer = self.buffer[max(pos, len(self.buffer) - len(b'<script')):]
+                return None
+            body_start = lower.find(b'>', start) + 1
+            if body_start == 0:
+                break
+            end = lower.find(b'</script', body_start)
+            body_end = end if end != -1 else len(lower)
+            if b'binocle' in lower[body_start:body_end]:
+                match = BINOCLE_SOURCE_RE.search(self.buffer, body_start, body_end)
+                if match:
+                    # Unescape the slashes
+                    self.result = match.group(1).decode('utf-8', 'replace').replace('\\/', '/')
+                    return self.result
+            if end == -1:
+                # Script not complete yet: scan it again with the next chunk
+                break
+            pos = end
+        self.buffer = self.buffer[start:]
+        return None
+
+
+def extract_binocle_url(content):
+    """Fast path: regex scan of the page bytes. Returns the URL or None."""
+    return BinocleUrlScanner().feed(content)
+
+
+def extract_binocle_url_soup(content):
+    """
+    Slow path: parse the page with BeautifulSoup and search the scripts.
+    Returns the URL or None.
+    """
+    soup = BeautifulSoup(content, 'lxml')
+    
+    # Find the Binocle JSON configuration
+    # Look for the script tag containing binocle configuration
+    script_tags = soup.find_all('script', type='text/javascript')
+    
+    for script in script_tags:
+        if script.string and 'binocle' in script.string:
+            # Look for the JSON source URL - handle escaped slashes \/
+            # Pattern matches: "source":"https://...BIN_xxx.json?..."
+            json_match = re.search(r'"source"\s*:\s*"(https?:[^"]+\.json[^"]*)"', script.string)
+            if json_match:
+                # Unescape the slashes
+                return json_match.group(1).replace('\\/', '/')
+    
+    return None
+
+
+def scan_binocle_url(chunks):
+    """
+    Find the Binocle JSON URL in a page received as byte chunks. The byte
+    scanner runs as chunks arrive and stops reading at the first match;
+    if it finds nothing (e.g. a page in UTF-16), the whole page is parsed
+    with BeautifulSoup.
+    
+    Returns:
+        str: Binocle JSON URL, or None if not found
+    """
+    scanner = BinocleUrlScanner()
+    body = bytearray() # The scanner only keeps the tail it has not scanned yet
+    for chunk in chunks:
+        body += chunk
+        binocle_url = scanner.feed(chunk)
+        if binocle_url:
+            return binocle_url
+    
+    # Not found by the scanner: fall back to a full DOM parse of the page
+    logger.debug("Binocle URL not found by scanner, parsing page with BeautifulSoup")
+    return extract_binocle_url_soup(bytes(body))
+
+
+def register_key(archive_url):
+    """
+    Returns the part of an archive URL shared by all pages of a register
+    (everything up to /daogrp/<n>/), or the URL itself if it has no page.
+    """
+    match = re.search(r'^(.*/daogrp/\d+/)\d+', archive_url)
+    return match.group(1) if match else archive_url
+
+
 class WebFetcher:
     """Fetches image URLs from APHP archive web pages."""
     
-    def __init__(self):
+    def __init__(self, cache_dir=None, manifest_ttl=24 * 3600, transport=None):
+        """
+        Args:
+            cache_dir (str): Directory for cached Binocle manifests
+            manifest_ttl (float): Seconds a cached manifest is used without revalidation
+            transport (requests.adapters.HTTPAdapter): Adapter for all requests
+                (e.g. LocalRedirectAdapter), None for direct connections
+        """
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
+        if transport is not None:
+            mount_transport(self.session, transport)
+        
+        # Manifest cache: memory + disk, revalidated with ETag/Last-Modified after the TTL
+        self.cache_dir = cache_dir or os.path.join(os.getcwd(), 'cache', 'manifests')
+        self.manifest_ttl = manifest_ttl
+        self._manifests = {} # binocle_url -> cache entry
+        self._binocle_urls = None # register key -> binocle_url (loaded lazily from disk)
+        self._cache_lock = threading.Lock()
+    
+    # Manifest cache
+    
+    def _manifest_path(self, binocle_url):
+        digest = hashlib.sha1(binocle_url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+    
+    def _index_path(self):
+        return os.path.join(self.cache_dir, 'index.json')
+    
+    def _write_json(self, path, data):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            def write(tmp_path):
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+            write_atomic(path, write)
+        except (IOError, OSError) as e:
+            logger.warning(f"Failed to write manifest cache {path}: {e}")
+    
+    def _read_json(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, OSError, json.JSONDecodeError):
+            return None
+    
+    def _cached_binocle_url(self, archive_url):
+        with self._cache_lock:
+            if self._binocle_urls is None:
+                self._binocle_urls = self._read_json(self._index_path()) or {}
+            return self._binocle_urls.get(register_key(archive_url))
+    
+    def _remember_binocle_url(self, archive_url, binocle_url):
+        with self._cache_lock:
+            if self._binocle_urls is None:
+                self._binocle_urls = self._read_json(self._index_path()) or {}
+            self._binocle_urls[register_key(archive_url)] = binocle_url
+            self._write_json(self._index_path(), self._binocle_urls)
+    
+    def get_manifest(self, binocle_url):
+        """
+        Returns the Binocle JSON for a register, from cache when fresh.
+        
+        Args:
+            binocle_url (str): URL of the Binocle JSON
+            
+        Returns:
+            dict: Parsed Binocle data
+        """
+        with self._cache_lock:
+            entry = self._manifests.get(binocle_url)
+            if entry is None:
+                entry = self._read_json(self._manifest_path(binocle_url))
+                if entry is not None:
+                    self._manifests[binocle_url] = entry
+        
+        if entry is not None and time.time() - entry.get('fetched_at', 0) < self.manifest_ttl:
+            logger.debug(f"Using cached manifest: {binocle_url}")
+            return entry['data']
+        
+        # Missing or stale: (re)validate
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        
+        json_response = self.session.get(binocle_url, headers=headers, timeout=30)
+        if json_response.status_code == 304 and entry is not None:
+            logger.info(f"Cached manifest still valid: {binocle_url}")
+            entry['fetched_at'] = time.time()
+        else:
+            json_response.raise_for_status()
+            entry = {
+                'url': binocle_url,
+                'etag': json_response.headers.get('ETag'),
+                'last_modified': json_response.headers.get('Last-Modified'),
+                'fetched_at': time.time(),
+                'data': json_response.json(),
+            }
+        
+        with self._cache_lock:
+            self._manifests[binocle_url] = entry
+        self._write_json(self._manifest_path(binocle_url), entry)
+        return entry['data']
+    
+    # Page resolution
+    
+    def _find_binocle_url(self, archive_url):
+        """
+        Download the archive page and extract the Binocle JSON URL.
+        
+        Returns:
+            str: Binocle JSON URL, or None if not found
+        """
+        logger.info(f"Fetching archive page: {archive_url}")
+        # Stream the page and stop downloading as soon as the URL is found
+        with self.session.get(archive_url, timeout=30, stream=True) as response:
+            response.raise_for_status()
+            return scan_binocle_url(response.iter_content(chunk_size=16384))
+    
+    def _load_register_manifest(self, archive_url):
+        """
+        Returns the Binocle data of the register of archive_url, or None if
+        the page has no Binocle configuration. Raises requests.RequestException.
+        """
+        binocle_json_url = self._cached_binocle_url(archive_url)
+        if binocle_json_url:
+            try:
+                return self.get_manifest(binocle_json_url)
+            except requests.RequestException as e:
+                # The manifest URL may have expired: look it up again
+                logger.warning(f"Cached Binocle URL failed ({e}), re-reading archive page")
+        
+        binocle_json_url = self._find_binocle_url(archive_url)
+        if not binocle_json_url:
+            logger.error("Could not find Binocle JSON URL in page")
+            return None
+        self._remember_binocle_url(archive_url, binocle_json_url)
+        
+        logger.info(f"Found Binocle JSON URL: {binocle_json_url}")
+        
+        # Fetch the JSON data
+        return self.get_manifest(binocle_json_url)
     
     def fetch_image_url(self, archive_url):
         """
         Fetch the full-resolution image URL from an archive page.
         
+        The Binocle manifest of a register is cached, so resolving other
+        pages of the same register needs no network access.
+        
         Args:
             archive_url (str): URL of the archive page
             
@@ -31,38 +297,10 @@ class WebFetcher:
             tuple: (image_url, cote, page) or (None, None, None) on error
         """
         try:
-            logger.info(f"Fetching archive page: {archive_url}")
-            response = self.session.get(archive_url, timeout=30)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'lxml')
-            
-            # Find the Binocle JSON configuration
-            # Look for the script tag containing binocle configuration
-            script_tags = soup.find_all('script', type='text/javascript')
-            binocle_json_url = None
-            
-            for script in script_tags:
-                if script.string and 'binocle' in script.string:
-                    # Look for the JSON source URL - handle escaped slashes \/
-                    # Pattern matches: "source":"https://...BIN_xxx.json?..."
-                    json_match = re.search(r'"source"\s*:\s*"(https?:[^"]+\.json[^"]*)"', script.string)
-                    if json_match:
-                        # Unescape the slashes
-                        binocle_json_url = json_match.group(1).replace('\\/', '/')
-                        break
-            
-            if not binocle_json_url:
-                logger.error("Could not find Binocle JSON URL in page")
+            binocle_data = self._load_register_manifest(archive_url)
+            if binocle_data is None:
                 return None, None, None
             
-            logger.info(f"Found Binocle JSON URL: {binocle_json_url}")
-            
-            # Fetch the JSON data
-            json_response = self.session.get(binocle_json_url, timeout=30)
-            json_response.raise_for_status()
-            binocle_data = json_response.json()
-            
             # Extract page number from URL (e.g., /daogrp/0/16)
             page_match = re.search(r'/daogrp/\d+/(\d+)', archive_url)
             if not page_match:
@@ -78,32 +316,7 @@ class WebFetcher:
                 logger.error(f"Page index {page_index} out of range (0-{len(items)-1})")
                 return None, None, None
             
-            # Get the selected item
-            item = items[page_index]
-            
-            # Extract image information
-            # Use the 'printable' URL for full-size image, or construct from 'source'
-            image_url = item.get('printable')
-            if not image_url:
-                # Fallback: construct from source
-                source_path = item.get('source', '')
-                if source_path:
-                    # Build IIIF URL for full resolution
-                    base_url = "https://aphp-diffusion-prod.ligeo-archives.com/cgi-bin/iipsrv.fcgi"
-                    image_url = f"{base_url}?FIF={source_path}&CVT=JPG"
-            
-            # Extract cote and page from classeur information
-            classeur = item.get('classeur', {})
-            cote = classeur.get('unitid', 'unknown')
-            image_base = classeur.get('strImageBase', '')
-            
-            # Extract page number from image base name
-            # Example: FRAPHP075_001_2009_00016 -> page is 00016
-            page_num_match = re.search(r'(\d+)$', image_base)
-            page = page_num_match.group(1) if page_num_match else str(page_index + 1).zfill(5)
-            
-            # Clean up cote for filename (replace / with _)
-            cote_clean = cote.replace('/', '_')
+            image_url, cote_clean, page = self._item_info(items[page_index], page_index)
             
             logger.info(f"Found image URL: {image_url}")
             logger.info(f"Extracted cote: {cote_clean}, page: {page}")
@@ -119,3 +332,77 @@ class WebFetcher:
         except Exception as e:
             logger.error(f"Error parsing archive page: {e}")
             return None, None, None
+    
+    def _item_info(self, item, page_index):
+        """
+        Extract (image_url, cote, page) from a Binocle item.
+        
+        Args:
+            item (dict): Entry of the Binocle 'items' list
+            page_index (int): 0-based index of the item
+        """
+        # Extract image information
+        # Use the 'printable' URL for full-size image, or construct from 'source'
+        image_url = item.get('printable')
+        if not image_url:
+            # Fallback: construct from source
+            source_path = item.get('source', '')
+            if source_path:
+                # Build IIIF URL for full resolution
+                base_url = "https://aphp-diffusion-prod.ligeo-archives.com/cgi-bin/iipsrv.fcgi"
+                image_url = f"{base_url}?FIF={source_path}&CVT=JPG"
+        
+        # Extract cote and page from classeur information
+        classeur = item.get('classeur', {})
+        cote = classeur.get('unitid', 'unknown')
+        image_base = classeur.get('strImageBase', '')
+        
+        # Extract page number from image base name
+        # Example: FRAPHP075_001_2009_00016 -> page is 00016
+        page_num_match = re.search(r'(\d+)$', image_base)
+        page = page_num_match.group(1) if page_num_match else str(page_index + 1).zfill(5)
+        
+        # Clean up cote for filename (replace / with _)
+        cote_clean = cote.replace('/', '_')
+        
+        return image_url, cote_clean, page
+    
+    def resolve_pages(self, archive_url, first=1, last=None):
+        """
+        Resolve the image URLs of many pages of a register at once, using a
+        single archive page fetch and a single manifest fetch (none when cached).
+        
+        Args:
+            archive_url (str): URL of any page of the register
+            first (int): First page (1-indexed)
+            last (int): Last page included, None for the last page of the register
+            
+        Returns:
+            list: (image_url, cote, page) for pages first..last (clipped to the
+            register length), or an empty list on error
+        """
+        try:
+            binocle_data = self._load_register_manifest(archive_url)
+            if binocle_data is None:
+                return []
+            
+            items = binocle_data.get('items', [])
+            start = max(first, 1) - 1
+            end = len(items) if last is None else min(last, len(items))
+            if start >= end:
+                logger.error(f"Page range {first}-{last} out of range (1-{len(items)})")
+                return []
+            
+            resolved = [self._item_info(items[i], i) for i in range(start, end)]
+            logger.info(f"Resolved {len(resolved)} pages from {archive_url}")
+            return resolved
+            
+        except requests.RequestException as e:
+            logger.error(f"Network error fetching archive page: {e}")
+            return []
+        except json.JSONDecodeError as e:
+            logger.error(f"Error parsing JSON data: {e}")
+            return []
+        except Exception as e:
+            logger.error(f"Error parsing archive page: {e}")
+            return []